@@ -0,0 +1,103 @@
+''' A local stand-in for the spacetime cache server. It answers
+GET /?q=<url>&u=<useragent> with the same CBOR payload the real server
+sends: {"url", "status", "response": pickled requests.Response}.
+
+    python -m benchmarks.cache_server --port 9000 [--graph --pages 5000]
+
+With --graph it serves a benchmarks.web_graph.SyntheticWeb, which a crawl
+can be pointed at with launch.py --cache_server 127.0.0.1:9000.
+'''
+import pickle
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import parse_qs, urlparse
+
+import cbor
+import requests
+
+from benchmarks.web_graph import SyntheticWeb
+
+
+def default_site(url):
+    ''' Every page links to ten children one level deeper. '''
+    links = "".join(
+        f'<a href="{url.rstrip("/")}/{i}">child {i}</a> ' for i in range(10))
+    body = f"<html><body><p>{' '.join(['page'] * 100)} {url}</p>{links}</body></html>"
+    return 200, {"Content-Type": "text/html"}, body.encode()
+
+
+def encode_response(url, status, headers, body, final_url=None):
+    ''' The CBOR payload the cache server returns for url. final_url is
+    where a redirect the server followed ended; the response then has the
+    301 for url in its history, as requests would. '''
+    raw = requests.models.Response()
+    raw.status_code = status
+    raw.url = final_url or url
+    raw.headers.update(headers)
+    raw._content = body
+    raw.encoding = "utf-8"
+    if final_url is not None:
+        hop = requests.models.Response()
+        hop.status_code = 301
+        hop.url = url
+        hop.headers["Location"] = final_url
+        raw.history = [hop]
+    return cbor.dumps({
+        "url": url, "status": status, "response": pickle.dumps(raw)})
+
+
+class CacheServerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        url = query.get("q", [""])[0]
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.server.requests += 1
+        payload = encode_response(url, *self.server.site(url))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_cache_server(site=default_site, host="127.0.0.1", port=0, latency=0):
+    ''' Serves site (url -> (status, headers, body[, final url])) on a
+    background thread. Returns the server; server.server_address is the
+    (host, port) to put in config.cache_server. '''
+    server = ThreadingHTTPServer((host, port), CacheServerHandler)
+    server.daemon_threads = True
+    server.site = site
+    server.latency = latency
+    server.requests = 0
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--graph", action="store_true", default=False)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    site = SyntheticWeb(pages=args.pages, seed=args.seed) if args.graph else default_site
+    server = start_cache_server(
+        site, host=args.host, port=args.port, latency=args.latency)
+    print(f"Serving on {server.server_address}")
+    if args.graph:
+        print(f"Seed urls: {','.join(site.seed_urls)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
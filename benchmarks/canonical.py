@@ -0,0 +1,59 @@
+''' Counts how many fetches url canonicalization saves on a corpus of url
+spellings: the number of distinct frontier keys under the old normalize +
+get_urlhash against the canonical ones.
+
+    python -m benchmarks.canonical [--corpus urls.txt]
+'''
+from argparse import ArgumentParser
+from hashlib import sha256
+from urllib.parse import urlparse
+
+from utils import get_urlhash, normalize
+
+# (path, query parameters) of the distinct pages in the synthetic corpus.
+PAGES = [("/", []), ("/about", []), ("/research/areas", []),
+         ("/~eppstein/pubs", []), ("/community/news", []),
+         ("/faculty/profiles/view_faculty.php", ["ucinetid=x", "show=all"])]
+ORIGINS = ["https://www.ics.uci.edu", "http://www.ics.uci.edu",
+           "https://ics.uci.edu", "https://WWW.ICS.UCI.EDU:443"]
+EXTRA_PARAMS = [[], ["utm_source=twitter"], ["replytocom=42"], ["share=facebook"]]
+
+
+def old_key(url):
+    ''' The frontier key before canonicalization: the old normalize (strip
+    trailing slashes) followed by the old get_urlhash. '''
+    parsed = urlparse(url.rstrip("/"))
+    return sha256(
+        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
+        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
+
+
+def synthetic_corpus():
+    ''' Spellings of the same few pages the crawler meets in links. '''
+    corpus = list()
+    for path, params in PAGES:
+        paths = [path, path.rstrip("/") + "/./x/..", path.rstrip("/") + "/index.html"]
+        for origin in ORIGINS:
+            for spelling in paths:
+                for extra in EXTRA_PARAMS:
+                    for order in (params, params[::-1]):
+                        query = "&".join(order + extra)
+                        url = origin + spelling + (f"?{query}" if query else "")
+                        corpus.extend([url, url + "#main"])
+    return sorted(set(corpus))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None,
+                        help="file with one url per line")
+    args = parser.parse_args()
+    if args.corpus:
+        with open(args.corpus) as corpus_file:
+            corpus = [line.strip() for line in corpus_file if line.strip()]
+    else:
+        corpus = synthetic_corpus()
+    before = len({old_key(url) for url in corpus})
+    after = len({get_urlhash(normalize(url)) for url in corpus})
+    print(f"{len(corpus)} urls: {before} fetches before, {after} after "
+          f"({before - after} saved)")
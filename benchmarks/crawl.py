@@ -0,0 +1,176 @@
+''' End-to-end crawl of a synthetic web graph (benchmarks/web_graph.py)
+served by the stand-in cache server in its own process, so its CPU time is
+not counted against the crawler.
+
+    python -m benchmarks.crawl --pages 5000 --threads 8 [--parsers 4] [--json out.json]
+
+Reports pages/s, CPU per page, peak RSS, how well near-duplicates were
+caught, how many trap urls were fetched and how many pages were fetched
+twice (through a redirect and directly). Compare the --json output of
+two revisions to catch regressions in scraper.py and crawler/.
+'''
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from configparser import ConfigParser
+
+from benchmarks.cache_server import start_cache_server
+from benchmarks.web_graph import SyntheticWeb, PAGE, DUPLICATE, BINARY
+
+GRAPH_OPTIONS = ("pages", "fan_out", "min_words", "max_words", "thin_fraction",
+                 "big_fraction", "missing_fraction", "binary_fraction",
+                 "dup_clusters", "dup_size",
+                 "trap_fraction", "redirect_fraction", "seed")
+
+
+def serve(graph, latency, ready):
+    server = start_cache_server(SyntheticWeb(**graph), latency=latency)
+    ready.put(server.server_address)
+    while True:
+        time.sleep(3600)
+
+
+def score(web, fetched, indexed):
+    ''' Dedup accuracy and trap fetches of a crawl, from the urls it
+    downloaded and the ones it indexed as unique pages. '''
+    clusters = defaultdict(lambda: [0, 0])
+    unique_fetched = unique_rejected = trap_fetches = binary_fetches = 0
+    # A page fetched through a redirecting alias counts as a fetch of the page.
+    pages = [web.content_url(url) for url in fetched]
+    refetches = len(pages) - len(set(pages))
+    for url in set(pages):
+        kind = web.kind(url)
+        if kind == DUPLICATE:
+            counts = clusters[web.cluster(url)]
+            counts[0] += 1
+            counts[1] += url in indexed
+        elif kind == PAGE:
+            unique_fetched += 1
+            unique_rejected += url not in indexed
+        elif kind == BINARY:
+            binary_fetches += 1
+        elif kind is None and ("/calendar/" in url or "/loop/" in url or "/bounce/" in url):
+            trap_fetches += 1
+    # Of every cluster one page should be indexed and the rest rejected.
+    expected = sum(fetched_count - 1 for fetched_count, _ in clusters.values())
+    caught = sum(fetched_count - max(indexed_count, 1)
+                 for fetched_count, indexed_count in clusters.values())
+    return {
+        "duplicates_fetched": expected,
+        "duplicates_caught": caught,
+        "dedup_recall": caught / expected if expected else 1.0,
+        "unique_fetched": unique_fetched,
+        "unique_rejected": unique_rejected,
+        "trap_fetches": trap_fetches,
+        "binary_fetches": binary_fetches,
+        "binary_pages": sum(kind == BINARY for kind in web.kinds.values()),
+        "page_refetches": refetches,
+    }
+
+
+def run(args):
+    graph = {name: getattr(args, name) for name in GRAPH_OPTIONS}
+    web = SyntheticWeb(**graph)
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    server = context.Process(target=serve, args=(graph, args.latency, ready), daemon=True)
+    server.start()
+    cache_server = ready.get()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cparser = ConfigParser()
+        cparser.read(args.config_file)
+        cparser["CRAWLER"]["SEEDURL"] = ",".join(web.seed_urls)
+        cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+        cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(tmp, "frontier.db")
+        cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(args.threads)
+        cparser["LOCAL PROPERTIES"]["PARSERS"] = str(args.parsers)
+        # Imported here so the server process does not load the crawler.
+        import scraper
+        from crawler import Crawler
+        from crawler.pipeline import PipelineCrawler
+        from utils.config import Config
+
+        quiet = open(os.devnull, "w")
+        with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+            config = Config(cparser)
+            config.cache_server = cache_server
+            crawler_class = PipelineCrawler if config.parser_processes else Crawler
+            before = resource.getrusage(resource.RUSAGE_SELF)
+            start = time.perf_counter()
+            crawler = crawler_class(config, True)
+            crawler.start()
+            elapsed = time.perf_counter() - start
+        quiet.close()
+        # Parser processes are reaped by now; the server process is not.
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = (self_usage.ru_utime - before.ru_utime + self_usage.ru_stime
+               - before.ru_stime + children.ru_utime + children.ru_stime)
+
+        db = sqlite3.connect(config.fetches_file)
+        fetched = [url for url, in db.execute("SELECT url FROM fetches")]
+        db.close()
+        indexed = {url for url, _ in scraper.stats.fingerprints()}
+    server.terminate()
+
+    result = {
+        "fetched": len(fetched),
+        "indexed": len(indexed),
+        "seconds": elapsed,
+        "pages_per_second": len(fetched) / elapsed,
+        "cpu_ms_per_page": 1000 * cpu / max(len(fetched), 1),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mb": self_usage.ru_maxrss / 1024,
+        "peak_child_rss_mb": children.ru_maxrss / 1024,
+    }
+    result.update(score(web, fetched, indexed))
+    return result
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--parsers", type=int, default=0)
+    parser.add_argument("--politeness", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--fan_out", type=int, default=10)
+    parser.add_argument("--min_words", type=int, default=200)
+    parser.add_argument("--max_words", type=int, default=2000)
+    parser.add_argument("--thin_fraction", type=float, default=0.05)
+    parser.add_argument("--big_fraction", type=float, default=0.005)
+    parser.add_argument("--missing_fraction", type=float, default=0.02)
+    parser.add_argument("--binary_fraction", type=float, default=0.05)
+    parser.add_argument("--dup_clusters", type=int, default=20)
+    parser.add_argument("--dup_size", type=int, default=5)
+    parser.add_argument("--trap_fraction", type=float, default=0.02)
+    parser.add_argument("--redirect_fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=str, default=None,
+                        help="also write the results to this file")
+    args = parser.parse_args()
+    result = run(args)
+    print(
+        f"{result['fetched']} pages fetched, {result['indexed']} indexed in "
+        f"{result['seconds']:.1f}s: {result['pages_per_second']:,.0f} pages/s, "
+        f"{result['cpu_ms_per_page']:.2f} ms CPU/page, peak RSS "
+        f"{result['peak_rss_mb']:.0f} MB (parsers {result['peak_child_rss_mb']:.0f} MB)")
+    print(
+        f"near-duplicates caught: {result['duplicates_caught']}/"
+        f"{result['duplicates_fetched']} ({result['dedup_recall']:.0%}), unique "
+        f"pages rejected: {result['unique_rejected']}/{result['unique_fetched']}, "
+        f"trap pages fetched: {result['trap_fetches']}, pages fetched twice: "
+        f"{result['page_refetches']}, binaries fetched: {result['binary_fetches']}/"
+        f"{result['binary_pages']}")
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(result, json_file, indent=1)
@@ -0,0 +1,104 @@
+''' A distributed crawl (crawler/distributed.py) of a synthetic web graph,
+with every node in its own local process, for 1, 2, 4... nodes.
+
+    python -m benchmarks.distributed --nodes 1,2,4 --pages 1000 --threads 2 --latency 0.1
+
+Reports pages/s per node count and checks that no url was fetched by two
+nodes. The cache server latency stands in for the network, so the crawl is
+bound by the download threads of each node and should scale with the node
+count while the hosts spread evenly over the nodes (and the box has the
+cores for the parsing). The graph has no traps: their long chains of pages
+on one host would only measure politeness.
+'''
+import contextlib
+import multiprocessing
+import os
+import socket
+import sqlite3
+import tempfile
+import time
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from benchmarks.crawl import serve
+from benchmarks.web_graph import SyntheticWeb
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_node(cparser, cache_server, node):
+    from crawler import Crawler
+    from crawler.distributed import PartitionedFrontier
+    from utils.config import Config
+
+    quiet = open(os.devnull, "w")
+    with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+        cparser["DISTRIBUTED"]["NODEID"] = str(node)
+        config = Config(cparser)
+        config.cache_server = cache_server
+        crawler = Crawler(config, True, frontier_factory=PartitionedFrontier)
+        crawler.start()
+
+
+def crawl(args, graph, cache_server, nodes, tmp):
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    cparser["CRAWLER"]["SEEDURL"] = ",".join(SyntheticWeb(**graph).seed_urls)
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(tmp, f"frontier{nodes}.db")
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(args.threads)
+    cparser["LOCAL PROPERTIES"]["PARSERS"] = "0"
+    cparser["DISTRIBUTED"] = {
+        "NODES": ",".join(f"127.0.0.1:{free_port()}" for _ in range(nodes)),
+        "FORWARDINTERVAL": "0.1"}
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_node, args=(cparser, cache_server, node))
+        for node in range(nodes)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    fetched = list()
+    for node in range(nodes):
+        save = cparser["LOCAL PROPERTIES"]["SAVE"]
+        db = sqlite3.connect(f"{save}.node{node}.fetches" if nodes > 1 else f"{save}.fetches")
+        fetched += [url for url, in db.execute("SELECT url FROM fetches")]
+        db.close()
+    return len(fetched), len(fetched) - len(set(fetched)), elapsed
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--nodes", type=str, default="1,2,4")
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--politeness", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--hosts", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    graph = {"pages": args.pages, "seed": args.seed, "trap_fraction": 0.0,
+             "hosts": [f"host{i}.ics.uci.edu" for i in range(args.hosts)]}
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    server = context.Process(target=serve, args=(graph, args.latency, ready), daemon=True)
+    server.start()
+    cache_server = ready.get()
+    base = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for nodes in map(int, args.nodes.split(",")):
+            fetched, twice, elapsed = crawl(args, graph, cache_server, nodes, tmp)
+            rate = fetched / elapsed
+            base = base or rate / nodes
+            print(f"{nodes} node(s): {fetched} pages in {elapsed:.1f}s, {rate:,.0f} pages/s "
+                  f"({rate / base:.1f}x one node), fetched by two nodes: {twice}")
+    server.terminate()
@@ -0,0 +1,51 @@
+''' Downloads from a local stand-in cache server with a new connection per
+request (the old requests.get) and with the pooled Session path.
+
+    python -m benchmarks.download --urls 2000 --latency 0.01
+'''
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+
+import requests
+
+from benchmarks.cache_server import start_cache_server
+from utils.config import Config
+from utils.download import cache_request, download, to_response
+
+
+def unpooled_download(url, config):
+    server, params = cache_request(url, config)
+    resp = requests.get(server, params=params)
+    return to_response(resp.status_code, resp.content, url)
+
+
+def timed(name, n_urls, func):
+    start = time.perf_counter()
+    responses = func()
+    elapsed = time.perf_counter() - start
+    assert all(resp.status == 200 for resp in responses)
+    print(f"{name:>9}: {n_urls / elapsed:,.0f} downloads/s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--urls", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    config = Config(cparser)
+    server = start_cache_server(latency=args.latency)
+    config.cache_server = server.server_address
+    urls = [f"https://www.ics.uci.edu/page/{i}" for i in range(args.urls)]
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        timed("unpooled", len(urls), lambda: list(
+            pool.map(lambda url: unpooled_download(url, config), urls)))
+        timed("session", len(urls), lambda: list(
+            pool.map(lambda url: download(url, config), urls)))
+    server.shutdown()
@@ -0,0 +1,45 @@
+''' Measures add/complete throughput of the frontier save file backends.
+
+    python -m benchmarks.frontier_store --urls 1000000
+'''
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from crawler.store import STORES
+from utils import get_urlhash
+
+
+def run(store_name, n_urls, flush_size):
+    urls = [f"https://www.ics.uci.edu/page/{i}" for i in range(n_urls)]
+    hashes = [get_urlhash(url) for url in urls]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = STORES[store_name](
+            os.path.join(tmp, "frontier"), flush_size=flush_size)
+        start = time.perf_counter()
+        for urlhash, url in zip(hashes, urls):
+            if urlhash not in store:
+                store.add(urlhash, url)
+        store.flush()
+        added = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for urlhash, url in zip(hashes, urls):
+            store.complete(urlhash, url)
+        store.flush()
+        completed = time.perf_counter() - start
+        store.close()
+    print(
+        f"{store_name:>6}: add {n_urls / added:,.0f} urls/s, "
+        f"complete {n_urls / completed:,.0f} urls/s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    parser.add_argument("--flush_size", type=int, default=1000)
+    parser.add_argument("--store", choices=list(STORES), action="append")
+    args = parser.parse_args()
+    for name in args.store or list(STORES):
+        run(name, args.urls, args.flush_size)
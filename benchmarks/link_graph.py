@@ -0,0 +1,71 @@
+''' Records a synthetic link graph through utils.link_graph.LinkGraph, then
+indexes and ranks it with utils.graph.LinkIndex.
+
+    python -m benchmarks.link_graph --pages 200000 --links 25
+
+Link targets follow a power law, like the in-degrees of the web. Reports
+edges/s recorded, the bytes per edge on disk, the time to build the CSR
+index, in-degree and PageRank, and the peak RSS.
+'''
+import os
+import random
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from utils.graph import LinkIndex
+from utils.link_graph import LinkGraph, files
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def record(path, n_pages, n_links, seed):
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    graph = LinkGraph()
+    graph.open(path, restart=True)
+    # Pareto-distributed targets: a few pages get most of the links.
+    targets = np.minimum(rng.pareto(1.2, n_pages * n_links) * 10, 4 * n_pages - 1).astype(np.int64)
+    start = time.perf_counter()
+    for page in range(n_pages):
+        links = targets[page * n_links:(page + 1) * n_links].tolist()
+        graph.add(f"https://www.ics.uci.edu/page/{page}",
+                  [(f"https://www.ics.uci.edu/page/{target}", f"link {words.randrange(1000)}")
+                   for target in links])
+    graph.close()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200_000)
+    parser.add_argument("--links", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    edges = args.pages * args.links
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph")
+        elapsed = record(path, args.pages, args.links, args.seed)
+        size = sum(os.path.getsize(name) for name in files(path).values())
+        print(f"recorded {edges:,} edges in {elapsed:.1f}s, {edges / elapsed:,.0f} edges/s, "
+              f"{size / edges:.1f} bytes/edge on disk")
+
+        start = time.perf_counter()
+        index = LinkIndex(path)
+        index.out_csr
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        degrees = index.in_degree()
+        degree_time = time.perf_counter() - start
+        start = time.perf_counter()
+        ranks = index.pagerank()
+        rank_time = time.perf_counter() - start
+        print(f"{len(index):,} urls: CSR index {built:.2f}s, in-degree {degree_time:.2f}s, "
+              f"PageRank {rank_time:.2f}s, peak RSS {peak_rss():,.0f} MB")
+        for url, rank in index.top(ranks, 3):
+            print(f"  {rank:.5f} {url} ({degrees[index.url_id(url)]:,} links in)")
@@ -0,0 +1,85 @@
+''' Compares the CPU cost per page of the old multi-parse filters in scraper.py
+against a single PageAnalysis, after checking that both see the same text:
+the tokens of PageAnalysis against those of BeautifulSoup's get_text, which
+leaves out scripts and styles.
+
+    python -m benchmarks.page_analysis --corpus path/to/saved/pages
+'''
+import glob
+import os
+import time
+from argparse import ArgumentParser
+
+from bs4 import BeautifulSoup
+from lxml import html
+
+import scraper
+
+
+def synthetic_pages(n_pages):
+    paragraph = "<p>" + " ".join(f"word{i % 500}" for i in range(200)) + "</p>"
+    links = "".join(f'<a href="/page/{i}#top">link {i}</a>' for i in range(100))
+    script = "<script>var tracker = {id: 42}; function load() { return tracker; }</script>"
+    return [
+        f"<html><head><title>Page {n}</title><style>p {{ color: red }}</style>{script}"
+        f"</head><body>{paragraph * 20}{script}after script{links}</body></html>".encode()
+        for n in range(n_pages)]
+
+
+def load_corpus(path):
+    pages = list()
+    for name in glob.glob(os.path.join(path, "**", "*.htm*"), recursive=True):
+        with open(name, "rb") as page:
+            pages.append(page.read())
+    return pages
+
+
+def multi_parse(page):
+    ''' The work the filters used to do for a page that passed them. '''
+    text = BeautifulSoup(page, "html.parser").get_text(separator=" ").strip()
+    len(set(scraper.tokenizeline(text)))
+    tree = html.fromstring(page)
+    len(tree.text_content()) / len(html.tostring(tree))
+    text = BeautifulSoup(page, "html.parser").get_text(separator=" ").strip()
+    scraper.simhash(text)
+    scraper.simhash(text)
+    html.fromstring(page).xpath("//a/@href")
+
+
+def old_tokens(page):
+    return scraper.tokenizeline(BeautifulSoup(page, "html.parser").get_text(separator=" ").strip())
+
+
+def mismatches(pages):
+    ''' The pages whose PageAnalysis tokens differ from old_tokens. '''
+    return [page for page in pages if scraper.PageAnalysis(page).tokens != old_tokens(page)]
+
+
+def single_parse(page):
+    analysis = scraper.PageAnalysis(page)
+    analysis.num_tokens
+    analysis.ratio
+    analysis.fingerprint
+    analysis.links
+
+
+def measure(func, pages):
+    start = time.process_time()
+    for page in pages:
+        func(page)
+    return (time.process_time() - start) / len(pages)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args()
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_pages(args.pages)
+    different = mismatches(pages)
+    print(f"text differs from the old extraction on {len(different)} of {len(pages)} pages")
+    before = measure(multi_parse, pages)
+    after = measure(single_parse, pages)
+    print(f"{len(pages)} pages")
+    print(f"multi parse:  {before * 1000:.2f} ms cpu/page")
+    print(f"single parse: {after * 1000:.2f} ms cpu/page ({before / after:.1f}x)")
@@ -0,0 +1,56 @@
+''' Decodes cache server payloads the old way (cbor.loads, then pickle.loads
+of the whole requests.Response) and with the lazy utils.response.Response,
+for a page whose body is only checked for size, one whose headers are read
+(an oversized page is rejected on those) and one whose body is read, at
+body sizes on both sides of utils.response.LAZY_BODY.
+
+    python -m benchmarks.response --sizes 1000 100000 1000000
+'''
+import pickle
+import timeit
+from argparse import ArgumentParser
+
+import cbor
+
+from benchmarks.cache_server import encode_response
+from utils.response import LAZY_BODY, Response, decode_payload
+
+
+def eager(payload):
+    resp_dict = cbor.loads(payload)
+    return pickle.loads(resp_dict["response"])
+
+
+def lazy_size(payload):
+    return Response(decode_payload(payload)).size
+
+
+def lazy_headers(payload):
+    return Response(decode_payload(payload)).raw_response.headers
+
+
+def lazy_content(payload):
+    return Response(decode_payload(payload)).raw_response.content
+
+
+def timed(func, payload, repeat):
+    ''' Microseconds per call, the best of five runs. '''
+    return 1e6 * min(timeit.repeat(lambda: func(payload), number=repeat, repeat=5)) / repeat
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1_000, 10_000, 100_000, 300_000, 1_000_000, 3_000_000])
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+    runs = (("eager", eager), ("lazy size", lazy_size),
+            ("lazy headers", lazy_headers), ("lazy content", lazy_content))
+    print(f"us per response; bodies of {LAZY_BODY:,} bytes and up are left in the pickle")
+    print(f"{'body bytes':>10}" + "".join(f"{name:>14}" for name, _ in runs))
+    for size in args.sizes:
+        payload = encode_response(
+            "https://www.ics.uci.edu/", 200, {"Content-Type": "text/html"},
+            b"x" * size)
+        print(f"{size:>10,}" + "".join(
+            f"{timed(func, payload, args.repeat):14.1f}" for _, func in runs))
@@ -0,0 +1,44 @@
+''' Memory per url and lookup rate of utils.seen.SeenSet compared to a
+Python set of url strings.
+
+    python -m benchmarks.seen_set --urls 10000000
+'''
+import sys
+import time
+from argparse import ArgumentParser
+
+from utils import get_urldigest
+from utils.seen import SeenSet
+
+
+def urls(n_urls, offset=0):
+    return (f"https://www.ics.uci.edu/~user/page{i}?id={i * 7}"
+            for i in range(offset, offset + n_urls))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    parser.add_argument("--bloom_bits", type=int, default=0)
+    parser.add_argument("--set_urls", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    seen = SeenSet(bloom_bits=args.bloom_bits)
+    start = time.perf_counter()
+    for url in urls(args.urls):
+        seen.add_digest(get_urldigest(url) or 1)
+    added = time.perf_counter() - start
+    # Half the lookups hit, half are new urls.
+    queries = [get_urldigest(url) or 1 for url in urls(args.lookups // 2)]
+    queries += [get_urldigest(url) or 1 for url in urls(args.lookups // 2, args.urls)]
+    start = time.perf_counter()
+    hits = sum(seen.contains_digest(digest) for digest in queries)
+    looked_up = time.perf_counter() - start
+    print(f"SeenSet, {args.urls:,} urls: {seen.nbytes / args.urls:.1f} bytes/url, "
+          f"{args.urls / added:,.0f} adds/s, {len(queries) / looked_up:,.0f} "
+          f"lookups/s ({hits} hits)")
+
+    strings = set(urls(args.set_urls))
+    size = sys.getsizeof(strings) + sum(sys.getsizeof(url) for url in strings)
+    print(f"set of str, {args.set_urls:,} urls: {size / args.set_urls:.1f} bytes/url")
@@ -0,0 +1,76 @@
+''' Compares the regex tokenizer and batched simhash in utils.simhash with
+the original per-character tokenizer and per-bit simhash loop, and checks
+that both produce the same tokens and fingerprints.
+
+    python -m benchmarks.simhash --words 20000
+'''
+import hashlib
+import random
+import re
+import time
+from argparse import ArgumentParser
+
+from utils.simhash import simhash_tokens, tokenize
+
+
+def loop_tokenize(line):
+    result = []
+    string = ""
+    line = line.lower()
+    for i in line:
+        if re.search("[a-zA-Z0-9]", i):
+            string += i
+        else:
+            if string != "":
+                result.append(string)
+            string = ""
+    if string != "":
+        result.append(string)
+    return result
+
+
+def loop_simhash(words):
+    vector = [0] * 64
+    for word in words:
+        hash_value = int(hashlib.md5(word.encode()).hexdigest(), 16) & ((1 << 64) - 1)
+        for i in range(64):
+            if (hash_value >> i) & 1:
+                vector[i] += 1
+            else:
+                vector[i] -= 1
+    fingerprint = 0
+    for i in range(64):
+        if vector[i] > 0:
+            fingerprint |= (1 << i)
+    return fingerprint
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--words", type=int, default=20000)
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+    random.seed(0)
+    vocabulary = [f"Word{i}" for i in range(3000)] + ["UCI", "ics", "2024"]
+    old_total = new_total = 0
+    for _ in range(args.pages):
+        text = " ".join(
+            random.choice(vocabulary) + random.choice(" ,.;-\n")
+            for _ in range(args.words))
+        old_tokens, old_tok = timed(loop_tokenize, text)
+        new_tokens, new_tok = timed(tokenize, text)
+        old_hash, old_sim = timed(loop_simhash, old_tokens)
+        new_hash, new_sim = timed(simhash_tokens, new_tokens)
+        assert old_tokens == new_tokens and old_hash == new_hash
+        old_total += old_tok + old_sim
+        new_total += new_tok + new_sim
+    print(f"{args.pages} pages of {args.words} words, identical output")
+    print(f"loop:    {old_total / args.pages * 1000:.2f} ms/page")
+    print(f"batched: {new_total / args.pages * 1000:.2f} ms/page "
+          f"({old_total / new_total:.1f}x)")
@@ -0,0 +1,55 @@
+''' Compares SimhashIndex against the old linear scan over all_hashes.
+
+    python -m benchmarks.simhash_index --fingerprints 1000000
+'''
+import random
+import time
+from argparse import ArgumentParser
+
+from utils.simhash import SimhashIndex
+
+
+def linear_scan(all_hashes, hash_value, distance=3):
+    for key, value in all_hashes.items():
+        if bin(hash_value ^ value).count("1") <= distance:
+            return key
+    return None
+
+
+def flip_bits(fingerprint, n_bits):
+    for bit in random.sample(range(64), n_bits):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--fingerprints", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--scan_queries", type=int, default=20)
+    args = parser.parse_args()
+    random.seed(0)
+    fingerprints = [random.getrandbits(64) for _ in range(args.fingerprints)]
+    # Half the queries are near duplicates of indexed pages, half are new.
+    queries = [
+        flip_bits(random.choice(fingerprints), random.randint(0, 3))
+        if i % 2 else random.getrandbits(64)
+        for i in range(args.queries)]
+
+    index = SimhashIndex(distance=3)
+    start = time.perf_counter()
+    for i, fingerprint in enumerate(fingerprints):
+        index.add(f"url{i}", fingerprint)
+    inserted = time.perf_counter() - start
+    start = time.perf_counter()
+    found = sum(index.query(query) is not None for query in queries)
+    queried = time.perf_counter() - start
+    print(f"index: {args.fingerprints / inserted:,.0f} inserts/s, "
+          f"{queried / len(queries) * 1e6:.1f} us/query, {found} matches")
+
+    all_hashes = {f"url{i}": fp for i, fp in enumerate(fingerprints)}
+    start = time.perf_counter()
+    for query in queries[:args.scan_queries]:
+        linear_scan(all_hashes, query)
+    scanned = time.perf_counter() - start
+    print(f"scan:  {scanned / args.scan_queries * 1e6:.1f} us/query")
@@ -0,0 +1,103 @@
+''' How long a resumed crawl takes to hand out its first url, from a save
+file of --urls urls on --hosts hosts, --completed of them done.
+
+    python -m benchmarks.startup --urls 1000000 --hosts 1000 --completed 0.3
+
+Every resume runs in a fresh process and is timed from its launch, so
+starting the interpreter and importing the crawler (and scraper.py) count
+too. The first one scans the save file, since there is no checkpoint yet,
+and writes the checkpoint. The second resumes from the checkpoint, queues
+--tail more urls and exits without a new snapshot, like a crash. The third
+resumes from the checkpoint and that journal.
+'''
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from crawler.store import STORES
+from utils import get_urlhash
+
+
+def build(path, store_name, n_urls, n_hosts, completed, seed):
+    rng = random.Random(seed)
+    store = STORES[store_name](path, flush_size=10_000)
+    for i in range(n_urls):
+        url = f"https://host{rng.randrange(n_hosts)}.ics.uci.edu/dir{i % 97}/page/{i}"
+        urlhash = get_urlhash(url)
+        store.add(urlhash, url, depth=rng.randrange(10))
+        if rng.random() < completed:
+            store.complete(urlhash, url)
+    store.close()
+
+
+def resume(cparser, launched, tail, results):
+    from crawler.frontier import Frontier
+    from utils.config import Config
+    imported = time.time()
+    frontier = Frontier(Config(cparser), False)
+    loaded = time.time()
+    url = frontier.get_tbd_url()
+    first = time.time()
+    if tail:
+        frontier.mark_url_complete(url)
+        for i in range(tail):
+            frontier.add_url(f"https://tail{i % 100}.ics.uci.edu/page/{i}")
+        frontier.save.flush()
+        frontier.checkpoint.flush()
+        results.put((imported - launched, loaded - imported, first - launched, 0.0, peak_rss()))
+        results.close()
+        results.join_thread()
+        # Exits like a crash would, leaving the journal in place.
+        os._exit(0)
+    frontier.close()
+    closed = time.time()
+    results.put((imported - launched, loaded - imported, first - launched, closed - first, peak_rss()))
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(cparser, label, tail=0):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=resume, args=(cparser, time.time(), tail, results))
+    process.start()
+    imported, loaded, first, closed, rss = results.get()
+    process.join()
+    print(f"{label:>24}: start and imports {imported:.2f}s, load {loaded:.2f}s, "
+          f"first url {first:.2f}s after launch, close {closed:.2f}s, "
+          f"peak RSS {rss:,.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--completed", type=float, default=0.3)
+    parser.add_argument("--tail", type=int, default=50_000)
+    parser.add_argument("--store", choices=list(STORES), default="sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        cparser = ConfigParser()
+        cparser.read(args.config_file)
+        save = os.path.join(tmp, "frontier.db")
+        cparser["LOCAL PROPERTIES"]["SAVE"] = save
+        cparser["LOCAL PROPERTIES"]["STORE"] = args.store
+        cparser["LOCAL PROPERTIES"]["EVENTS"] = ""
+        start = time.perf_counter()
+        build(save, args.store, args.urls, args.hosts, args.completed, args.seed)
+        print(f"Built a save file of {args.urls:,} urls in {time.perf_counter() - start:.1f}s.")
+        run(cparser, "scan of the save file")
+        size = os.path.getsize(save + ".checkpoint")
+        print(f"{'':>24}  checkpoint {size / 2**20:,.1f} MB, save file "
+              f"{os.path.getsize(save) / 2**20:,.1f} MB")
+        run(cparser, "checkpoint", tail=args.tail)
+        run(cparser, f"checkpoint + {args.tail:,} tail")
@@ -0,0 +1,75 @@
+''' Throughput of scraper.url_filter against the old per-call regex checks.
+
+    python -m benchmarks.url_filter --urls 1000000
+'''
+import random
+import re
+import time
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+import scraper
+
+OLD_DOMAINS = [r"^https?://(?:\w+\.)?ics\.uci\.edu/?.*",
+               r"^https?://(?:\w+\.)?cs\.uci\.edu/?.*",
+               r"^https?://(?:\w+\.)?informatics\.uci\.edu/?.*",
+               r"^https?://(?:\w+\.)?stat\.uci\.edu/?.*"]
+
+OLD_EXTENSIONS = (
+    r".*\.(css|js|bmp|gif|jpe?g|ico"
+    + r"|png|tiff?|mid|mp2|mp3|mp4"
+    + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+    + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+    + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+    + r"|epub|dll|cnf|tgz|sha1"
+    + r"|thmx|mso|arff|rtf|jar|csv"
+    + r"|rm|smil|wmv|swf|wma|zip|rar|gz|img|apk|war|sql|mpg)$")
+
+
+def old_valid_link(link):
+    return any(re.findall(pattern, link) for pattern in OLD_DOMAINS)
+
+
+def old_verdict(url):
+    ''' trapDection followed by is_valid, as the scraper used to run them. '''
+    kept = [url for pattern in scraper.urls_to_avoid
+            if re.search(pattern, url) is None and old_valid_link(url)]
+    if not kept:
+        return False
+    parsed = urlparse(url)
+    return (parsed.scheme in {"http", "https"} and old_valid_link(url)
+            and not re.match(OLD_EXTENSIONS, parsed.path.lower()))
+
+
+def corpus(n_urls):
+    random.seed(0)
+    hosts = ["www.ics.uci.edu", "vision.ics.uci.edu", "www.cs.uci.edu",
+             "www.informatics.uci.edu", "www.stat.uci.edu", "www.google.com",
+             "wics.ics.uci.edu", "uci.edu"]
+    paths = ["/about", "/research/projects", "/events/2023-05-01",
+             "/people/faculty", "/~user/paper.pdf", "/files/data.csv",
+             "/index.php", "/courses/cs121/", "/happening/news"]
+    return [
+        f"{random.choice(['http', 'https'])}://{random.choice(hosts)}"
+        f"{random.choice(paths)}?p={random.randint(0, 1000)}"
+        for _ in range(n_urls)]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    parser.add_argument("--old_urls", type=int, default=100_000)
+    args = parser.parse_args()
+    urls = corpus(args.urls)
+
+    start = time.perf_counter()
+    accepted = sum(scraper.url_filter.check(url) is None for url in urls)
+    elapsed = time.perf_counter() - start
+    print(f"UrlFilter: {len(urls) / elapsed:,.0f} urls/s, {accepted} accepted")
+
+    sample = urls[:args.old_urls]
+    start = time.perf_counter()
+    accepted = sum(old_verdict(url) for url in sample)
+    elapsed = time.perf_counter() - start
+    print(f"old regex: {len(sample) / elapsed:,.0f} urls/s "
+          f"({accepted} of {len(sample)} accepted)")
@@ -0,0 +1,200 @@
+''' A synthetic web graph for the stand-in cache server: pages of random
+size and fan-out spread over a few hosts in the crawl domains, with thin,
+oversized, missing and binary pages, clusters of near-duplicate pages, trap
+structures (an endless calendar and an endlessly deep relative link) and
+redirecting aliases of pages.
+
+    from benchmarks.web_graph import SyntheticWeb
+    web = SyntheticWeb(pages=5000, dup_clusters=50)
+    server = start_cache_server(web)
+'''
+import random
+import re
+from datetime import date, timedelta
+from threading import Lock
+from urllib.parse import urlsplit
+
+HOSTS = ["www.ics.uci.edu", "vision.ics.uci.edu", "www.informatics.uci.edu",
+         "www.stat.uci.edu"]
+HTML = {"Content-Type": "text/html; charset=utf-8"}
+NOT_FOUND = (404, HTML, b"<html><body>Not found</body></html>")
+PAGE_PATH = re.compile(r"/(?:page|files)/(\d+)$")
+CALENDAR_PATH = re.compile(r"/calendar/(\d{4})-(\d{2})-(\d{2})$")
+# /go/<id> is redirected to page id by the cache server, /moved/<id> answers
+# 301 with a Location, /bounce/<n> 301s back and forth between n and n+1.
+ALIAS_PATH = re.compile(r"/(go|moved|bounce)/(\d+)$")
+
+# Page kinds.
+PAGE = "page"
+THIN = "thin"
+BIG = "big"
+MISSING = "missing"
+DUPLICATE = "duplicate"
+# A pdf under /files/ without an extension, half of them served as text/html.
+BINARY = "binary"
+
+
+class SyntheticWeb(object):
+    ''' site callable for benchmarks.cache_server.start_cache_server.
+
+    Page i lives at https://<host>/page/<i> and links to fan_out random
+    pages; a trap_fraction of the pages also links into a trap. The page
+    kinds are drawn once from seed, so every run serves the same graph.
+    Pages in the same duplicate cluster have the same text and only differ
+    in their links. A redirect_fraction of the links goes through an alias
+    that redirects to the page, and some pages link into a redirect loop.
+    fetched holds every url served, so the benchmark can score the crawl
+    against the graph. '''
+
+    def __init__(self, pages=2000, hosts=HOSTS, fan_out=10, min_words=200,
+                 max_words=2000, thin_fraction=0.05, big_fraction=0.005,
+                 missing_fraction=0.02, binary_fraction=0.05, dup_clusters=20,
+                 dup_size=5, trap_fraction=0.02, redirect_fraction=0.1, seed=0):
+        self.pages = pages
+        self.hosts = hosts
+        self.fan_out = fan_out
+        self.min_words = min_words
+        self.max_words = max_words
+        self.trap_fraction = trap_fraction
+        self.redirect_fraction = redirect_fraction
+        self.seed = seed
+        self.fetched = set()
+        self.lock = Lock()
+        rnd = random.Random(seed)
+        # The first page of every host is a seed and always a normal page.
+        ids = list(range(len(hosts), pages))
+        rnd.shuffle(ids)
+        self.kinds = dict()
+        self.clusters = dict()
+        for cluster in range(dup_clusters):
+            for _ in range(dup_size):
+                if ids:
+                    page_id = ids.pop()
+                    self.kinds[page_id] = DUPLICATE
+                    self.clusters[page_id] = cluster
+        for kind, fraction in ((THIN, thin_fraction), (BIG, big_fraction),
+                               (MISSING, missing_fraction), (BINARY, binary_fraction)):
+            for _ in range(int(pages * fraction)):
+                if ids:
+                    self.kinds[ids.pop()] = kind
+        self.big_body = None
+
+    @property
+    def seed_urls(self):
+        return [self.url(page_id) for page_id in range(min(len(self.hosts), self.pages))]
+
+    def url(self, page_id):
+        directory = "files" if self.kinds.get(page_id) == BINARY else "page"
+        return f"https://{self.hosts[page_id % len(self.hosts)]}/{directory}/{page_id}"
+
+    def kind(self, url):
+        ''' The kind of the page at url, or None if it is not a graph page
+        (robots.txt, traps). '''
+        match = PAGE_PATH.search(urlsplit(url).path)
+        if match is None or int(match.group(1)) >= self.pages:
+            return None
+        return self.kinds.get(int(match.group(1)), PAGE)
+
+    def alias(self, rnd, page_id):
+        ''' A link to page_id, through a redirect a redirect_fraction of the time. '''
+        if rnd.random() >= self.redirect_fraction:
+            return self.url(page_id)
+        host = self.hosts[page_id % len(self.hosts)]
+        return f"https://{host}/{rnd.choice(('go', 'moved'))}/{page_id}"
+
+    def content_url(self, url):
+        ''' The page url whose content a fetch of url returns. '''
+        match = ALIAS_PATH.search(urlsplit(url).path)
+        if match is not None and match.group(1) == "go" and int(match.group(2)) < self.pages:
+            return self.url(int(match.group(2)))
+        return url
+
+    def cluster(self, url):
+        match = PAGE_PATH.search(urlsplit(url).path)
+        return self.clusters.get(int(match.group(1))) if match else None
+
+    def words(self, rnd, count):
+        # Log-uniform ranks over a 50000 word vocabulary, rotated by a random
+        # topic: each page has its own few common words and a long tail, so
+        # unrelated pages do not get near-identical fingerprints.
+        topic = rnd.randrange(50_000)
+        return " ".join(
+            f"word{(int(5000 ** rnd.random()) + topic) % 50_000}" for _ in range(count))
+
+    def __call__(self, url):
+        with self.lock:
+            self.fetched.add(url)
+        parts = urlsplit(url)
+        match = PAGE_PATH.search(parts.path)
+        if match is not None and int(match.group(1)) < self.pages:
+            return self.page(int(match.group(1)))
+        match = ALIAS_PATH.search(parts.path)
+        if match is not None:
+            return self.redirect(parts.netloc, match.group(1), int(match.group(2)))
+        match = CALENDAR_PATH.search(parts.path)
+        if match is not None:
+            return self.calendar(parts.netloc, date(*map(int, match.groups())))
+        if "/loop/" in parts.path:
+            return self.loop(parts.path)
+        return NOT_FOUND
+
+    def page(self, page_id):
+        kind = self.kinds.get(page_id, PAGE)
+        if kind == MISSING:
+            return NOT_FOUND
+        if kind == BINARY:
+            content_type = "text/html" if page_id % 2 else "application/pdf"
+            body = b"%PDF-1.4\n" + random.Random(page_id).randbytes(20_000)
+            return 200, {"Content-Type": content_type}, body
+        if kind == BIG:
+            if self.big_body is None:
+                self.big_body = ("<html><body><p>"
+                                 + self.words(random.Random(self.seed), 300_000)
+                                 + "</p></body></html>").encode()
+            return 200, HTML, self.big_body
+        rnd = random.Random(self.seed * 1_000_003 + page_id)
+        links = [self.alias(rnd, rnd.randrange(self.pages)) for _ in range(self.fan_out)]
+        if rnd.random() < self.trap_fraction:
+            host = self.hosts[page_id % len(self.hosts)]
+            links.append(rnd.choice([
+                f"https://{host}/calendar/2024-01-01",
+                f"https://{host}/loop/start/",
+                f"https://{host}/bounce/{2 * rnd.randrange(10)}"]))
+        if kind == THIN:
+            text = self.words(rnd, 10)
+        elif kind == DUPLICATE:
+            cluster_rnd = random.Random(self.seed * 7_919 + self.clusters[page_id])
+            text = self.words(cluster_rnd, cluster_rnd.randint(self.min_words, self.max_words))
+        else:
+            text = self.words(rnd, rnd.randint(self.min_words, self.max_words))
+        anchors = "".join(f'<li><a href="{link}">more</a></li>' for link in links)
+        body = f"<html><body><p>{text}</p><ul>{anchors}</ul></body></html>"
+        return 200, HTML, body.encode()
+
+    def redirect(self, host, kind, number):
+        ''' A followed redirect is served as the target page with the url it
+        ended on; the others as a 301. '''
+        if kind == "bounce":
+            other = number + 1 if number % 2 == 0 else number - 1
+            return 301, {"Location": f"/bounce/{other}"}, b""
+        if number >= self.pages:
+            return NOT_FOUND
+        if kind == "moved":
+            return 301, {"Location": urlsplit(self.url(number)).path}, b""
+        return (*self.page(number), self.url(number))
+
+    def calendar(self, host, day):
+        ''' One page per day, forever, each linking to the next day and month. '''
+        links = [day + timedelta(days=1), day - timedelta(days=1), day + timedelta(days=31)]
+        anchors = "".join(
+            f'<a href="https://{host}/calendar/{link.isoformat()}">{link}</a> '
+            for link in links)
+        body = (f"<html><body><h1>Events on {day.isoformat()}</h1>"
+                f"<p>There are no events.</p>{anchors}</body></html>")
+        return 200, HTML, body.encode()
+
+    def loop(self, path):
+        ''' The same page at every depth, linking one level deeper. '''
+        text = self.words(random.Random(self.seed), 300)
+        body = f'<html><body><p>{text}</p><a href="more/">more</a></body></html>'
+        return 200, HTML, body.encode()
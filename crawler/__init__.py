@@ -1,11 +1,27 @@
 from utils import get_logger
+from utils.logs import logs
+from utils.canonical import configure as configure_canonical
+from utils.metrics import metrics
+import scraper
 from crawler.frontier import Frontier
 from crawler.worker import Worker
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
+        logs.configure(
+            config.log_dir, config.log_level, config.console_level,
+            config.log_max_bytes, config.log_backups, config.events_file)
         self.logger = get_logger("CRAWLER")
+        configure_canonical(config.strip_params)
+        if config.metrics_file:
+            metrics.start(config.metrics_file, config.metrics_interval)
+        scraper.load_stats(
+            config.stats_file, restart, flush_interval=config.flush_interval)
+        scraper.load_traps(
+            config.traps_file, restart, flush_interval=config.flush_interval)
+        scraper.load_link_graph(
+            config.link_graph_file, restart, flush_interval=config.flush_interval)
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
@@ -19,7 +35,13 @@ class Crawler(object):
 
     def start(self):
         self.start_async()
-        self.join()
+        try:
+            self.join()
+        finally:
+            # Also on Ctrl-C, with the workers still running: they stop
+            # once the frontier is closed.
+            self.frontier.close()
+            metrics.stop()
 
     def join(self):
         for worker in self.workers:
@@ -0,0 +1,216 @@
+import os
+import struct
+import time
+from array import array
+from heapq import heapify
+
+from utils.seen import SeenSet
+
+# Snapshot header: magic, slots of the seen-url table, urls in it, bytes of
+# its Bloom filter and hosts with queued urls. Every host follows as its name
+# and url count, then the priorities, the depths and the urls of its queue
+# in heap order, the urls joined by newlines (canonical urls have none).
+MAGIC = b"FRONTCK1"
+HEADER = struct.Struct("<8sQQQQ")
+HOST = struct.Struct("<IIQ")
+# Journal records: operation, depth, priority and seen-set digest of the
+# url and the length of the url that follows.
+RECORD = struct.Struct("<BidQI")
+ADD, COMPLETE = 1, 2
+# Heap sequence numbers of urls loaded from a checkpoint start here, below
+# those of urls found since (see Frontier.get_tbd_url).
+UNCHECKED = -(1 << 62)
+
+
+class Checkpoint(object):
+    ''' A compact copy of what the frontier needs to resume: a snapshot of
+    the seen-url set and of the queued urls, per host and in heap order, plus
+    a journal of the urls added and completed since the snapshot was taken.
+    Resuming reads the two files instead of every row of the save file;
+    the journal keeps the digest and priority of each url, so no url is
+    hashed or ranked again.
+
+    The save file stays the record of the crawl. A checkpoint is only used
+    if it accounts for as many urls as the save file holds; after a crash
+    that lost part of the journal, or with no checkpoint at all, the
+    frontier scans the save file and writes a new one. The journal is
+    written in batches like the save file, and a new snapshot replaces it
+    once it holds compact_size records. '''
+
+    def __init__(self, path, restart=False, flush_size=1000, flush_interval=5.0,
+                 compact_size=200_000):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.compact_size = compact_size
+        if restart:
+            for name in self.files(path):
+                if os.path.exists(name):
+                    os.remove(name)
+        self.journal = None
+        self.buffer = bytearray()
+        self.buffered = 0
+        self.records = 0
+        self.last_flush = time.monotonic()
+
+    def load(self, expected, bloom_bits=0):
+        ''' (seen set, [(host, queue)], [(url, depth, priority)] added since
+        the snapshot and not completed) if the checkpoint covers the expected
+        number of urls, else None. The queues are heaps of (priority, seq,
+        url, depth) with seq from UNCHECKED up; the urls after them are to be
+        queued by the caller. '''
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as file:
+            data = file.read()
+        try:
+            seen, queues = self._read_snapshot(memoryview(data), bloom_bits)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            return None
+        added, done = self._read_journal()
+        tail = list()
+        for url, (depth, priority, digest) in added.items():
+            if seen.add_digest(digest):
+                tail.append((url, depth, priority))
+        for digest in done.values():
+            if digest:
+                seen.add_digest(digest)
+        if len(seen) != expected:
+            return None
+        if done:
+            for index, (host, queue) in enumerate(queues):
+                kept = [entry for entry in queue if entry[2] not in done]
+                if len(kept) < len(queue):
+                    heapify(kept)
+                    queues[index] = (host, kept)
+        self.records = len(added) + len(done)
+        return seen, [(host, queue) for host, queue in queues if queue], tail
+
+    def _read_snapshot(self, view, bloom_bits):
+        magic, slots, count, bloom_size, hosts = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("not a frontier checkpoint")
+        pos = HEADER.size
+        table = array("Q")
+        table.frombytes(view[pos:pos + 8 * slots])
+        pos += 8 * slots
+        bloom = view[pos:pos + bloom_size]
+        pos += bloom_size
+        seen = SeenSet.restore(table, count, bloom, bloom_bits)
+        queues = list()
+        seq = UNCHECKED
+        for _ in range(hosts):
+            name_size, size, urls_size = HOST.unpack_from(view, pos)
+            pos += HOST.size
+            host = str(view[pos:pos + name_size], "utf-8")
+            pos += name_size
+            priorities = array("d")
+            priorities.frombytes(view[pos:pos + 8 * size])
+            pos += 8 * size
+            depths = array("i")
+            depths.frombytes(view[pos:pos + 4 * size])
+            pos += 4 * size
+            urls = str(view[pos:pos + urls_size], "utf-8").split("\n")
+            pos += urls_size
+            if len(urls) != size or len(depths) != size:
+                raise ValueError("truncated checkpoint")
+            # Sequence numbers ascending in heap order keep the heap a heap.
+            queues.append((host, list(zip(priorities, range(seq, seq + size), urls, depths))))
+            seq += size
+        return seen, queues
+
+    def _read_journal(self):
+        ''' (url -> (depth, priority, digest) of the urls added, url ->
+        digest of the urls completed) since the snapshot, in the order they
+        were logged. A record cut short by a crash ends the journal. '''
+        added, done = dict(), dict()
+        if not os.path.exists(self.journal_path):
+            return added, done
+        with open(self.journal_path, "rb") as file:
+            data = file.read()
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            op, depth, priority, digest, size = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            if pos + size > len(data):
+                break
+            url = data[pos:pos + size].decode("utf-8", "replace")
+            pos += size
+            if op == ADD:
+                added[url] = (depth, priority, digest)
+            else:
+                # Completed within the journal: seen, but not queued.
+                entry = added.pop(url, None)
+                done[url] = entry[2] if entry is not None else 0
+        return added, done
+
+    def add(self, url, depth, priority, digest):
+        self._log(ADD, url, depth, priority, digest)
+
+    def complete(self, url):
+        self._log(COMPLETE, url)
+
+    def _log(self, op, url, depth=0, priority=0.0, digest=0):
+        url = url.encode("utf-8")
+        self.buffer += RECORD.pack(op, depth, priority, digest, len(url))
+        self.buffer += url
+        self.buffered += 1
+        self.records += 1
+        if (self.buffered >= self.flush_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    @property
+    def due(self):
+        ''' True once the journal is long enough to be worth a new snapshot. '''
+        return self.records >= self.compact_size
+
+    def write(self, seen, queues):
+        ''' Replaces the snapshot with seen and queues, (host, heap of
+        (priority, seq, url, depth)) pairs, and starts an empty journal. The
+        snapshot is written next to the old one and renamed over it, so a
+        crash leaves one or the other. '''
+        table, count, bloom = seen.snapshot()
+        queues = [(host, queue) for host, queue in queues if queue]
+        temp = self.path + ".tmp"
+        with open(temp, "wb") as file:
+            file.write(HEADER.pack(MAGIC, len(table), count, len(bloom), len(queues)))
+            file.write(memoryview(table).cast("B"))
+            file.write(bloom)
+            for host, queue in queues:
+                name = host.encode("utf-8")
+                urls = "\n".join(entry[2] for entry in queue).encode("utf-8")
+                file.write(HOST.pack(len(name), len(queue), len(urls)))
+                file.write(name)
+                file.write(array("d", (entry[0] for entry in queue)).tobytes())
+                file.write(array("i", (entry[3] for entry in queue)).tobytes())
+                file.write(urls)
+        os.replace(temp, self.path)
+        # Records logged before the snapshot are in it; replaying them again
+        # after a crash right here would change nothing.
+        self.buffer.clear()
+        self.buffered = self.records = 0
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(self.journal_path, "wb")
+
+    def flush(self):
+        if self.buffer:
+            if self.journal is None:
+                self.journal = open(self.journal_path, "ab")
+            self.journal.write(self.buffer)
+            self.journal.flush()
+            self.buffer.clear()
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    @staticmethod
+    def files(path):
+        return [path, path + ".journal", path + ".tmp"]
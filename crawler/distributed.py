@@ -0,0 +1,278 @@
+import bisect
+import hashlib
+import itertools
+import json
+import socket
+import socketserver
+import time
+from collections import Counter
+from threading import Thread, Event, Lock
+from urllib.parse import urlparse
+
+from utils import normalize
+from utils.metrics import metrics
+from utils.seen import SeenSet
+from crawler.frontier import Frontier
+
+FORWARDED = metrics.counter(
+    "links_forwarded", "Links sent to the node that owns their host.", "node")
+RECEIVED = metrics.counter("links_received", "Links received from other nodes.")
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HostRing(object):
+    ''' Consistent hashing of hosts onto nodes. Every node gets replicas
+    points on a ring of 64-bit hashes and a host belongs to the node of the
+    first point at or after its hash, so adding or removing a node only
+    moves the hosts next to its points. '''
+
+    def __init__(self, nodes, replicas=64):
+        points = sorted(
+            (ring_hash(f"{node}#{replica}"), index)
+            for index, node in enumerate(nodes) for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.owners = [index for _, index in points]
+
+    def owner(self, host):
+        ''' Index of the node that owns host. '''
+        position = bisect.bisect(self.hashes, ring_hash(host)) % len(self.hashes)
+        return self.owners[position]
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class Peer(object):
+    ''' A JSON-lines connection to another node: one request line, one
+    reply line. Connects on first use and reconnects after an error, so
+    nodes can be started in any order. '''
+
+    def __init__(self, address, timeout=30):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self.sock = None
+        self.lock = Lock()
+
+    def request(self, message):
+        ''' Sends message and returns the reply. Raises OSError if the node
+        cannot be reached. '''
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self.sock = socket.create_connection(self.address, self.timeout)
+                    self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self.reader = self.sock.makefile("rb")
+                self.sock.sendall(json.dumps(message).encode() + b"\n")
+                line = self.reader.readline()
+                if not line:
+                    raise ConnectionError("connection closed")
+                return json.loads(line)
+            except (OSError, ValueError):
+                self.close()
+                raise OSError(f"node {self.address[0]}:{self.address[1]} unreachable")
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class LinkHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            reply = self.server.frontier.handle(json.loads(line))
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class LinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class PartitionedFrontier(Frontier):
+    ''' The frontier of one node of a distributed crawl (NODES in the
+    config). It only queues urls whose host this node owns on the HostRing,
+    so politeness, robots.txt and dedup stay local to each node. Links to
+    other hosts are collected per owner and forwarded in batches of
+    forward_batch urls, or every forward_interval seconds, over a socket to
+    the owner, which queues them like its own.
+
+    A page is only marked complete once the links it had for other nodes
+    are sent, so after a crash it is fetched again and its links are found
+    again rather than lost with the outbox.
+
+    The crawl is over when every node is idle (nothing queued, fetching or
+    being forwarded) and as many batches were received as were sent, twice
+    in a row with the same counts. Node 0 polls the others for that and
+    then tells them to stop. '''
+
+    def __init__(self, config, restart):
+        self.node_id = config.node_id
+        self.ring = HostRing(config.nodes)
+        self.peers = {
+            index: Peer(address) for index, address in enumerate(config.nodes)
+            if index != config.node_id}
+        # Links waiting to be sent, (url, depth, parent) per node, and urls
+        # already sent.
+        self.outbox = {index: list() for index in self.peers}
+        self.forwarded = SeenSet()
+        # parent -> its links still in an outbox, and url -> depth of the
+        # pages fetched but not marked complete until those are sent.
+        self.unsent = Counter()
+        self.deferred = dict()
+        self.in_flight = 0
+        self.sent = self.received = 0
+        self.stopped = False
+        self.forward_now = Event()
+        super().__init__(config, restart)
+        self.server = LinkServer(
+            parse_address(config.nodes[config.node_id]), LinkHandler)
+        self.server.frontier = self
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        Thread(target=self._forward, daemon=True).start()
+        if self.node_id == 0:
+            Thread(target=self._detect_termination, daemon=True).start()
+
+    def add_url(self, url, parent=None):
+        if self.closed:
+            return
+        url = normalize(url)
+        node = self.ring.owner(urlparse(url).netloc)
+        if node == self.node_id:
+            return super().add_url(url, parent)
+        with self.lock:
+            if self.forwarded.add(url):
+                outbox = self.outbox[node]
+                outbox.append((url, self._depth(url, parent), parent))
+                if parent is not None:
+                    self.unsent[parent] += 1
+                if len(outbox) >= self.config.forward_batch:
+                    self.forward_now.set()
+
+    def _complete(self, url):
+        if self.unsent[url]:
+            self.deferred[url] = self.depths.get(url, 0)
+        else:
+            super()._complete(url)
+
+    def _sent(self, links):
+        ''' Completes the pages deferred until links were sent. '''
+        for _, _, parent in links:
+            if parent is None:
+                continue
+            self.unsent[parent] -= 1
+            if not self.unsent[parent]:
+                del self.unsent[parent]
+                depth = self.deferred.pop(parent, None)
+                if depth is not None and not self.closed:
+                    super()._complete(parent)
+
+    def _unfinished(self):
+        # Deferred pages go into checkpoints as queued, like the save file
+        # has them.
+        return itertools.chain(self.depths.items(), self.deferred.items())
+
+    def handle(self, message):
+        ''' Answers a request from another node. '''
+        kind = message["type"]
+        if kind == "links":
+            with self.lock:
+                for url, depth in message["links"]:
+                    if self.closed:
+                        break
+                    if self.robots.allowed(url) is not False:
+                        digest = self.seen.digest(url)
+                        if self.seen.add_digest(digest):
+                            self._add(url, depth, digest)
+                self.received += 1
+            RECEIVED.inc(value=len(message["links"]))
+            return {"ok": True}
+        if kind == "status":
+            return self.status()
+        if kind == "stop":
+            self.stop()
+            return {"ok": True}
+        raise ValueError(f"unknown message {kind}")
+
+    def status(self):
+        with self.lock:
+            idle = not (self.host_queues or self.in_progress or self.in_flight
+                        or any(self.outbox.values()))
+            return {"idle": idle, "sent": self.sent, "received": self.received}
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            self.has_work.notify_all()
+
+    def idle(self):
+        if not self.stopped:
+            # Links may still come from other nodes.
+            self.forward_now.set()
+            self.has_work.wait(self.config.forward_interval)
+        return self.stopped
+
+    def _forward(self):
+        while True:
+            self.forward_now.wait(self.config.forward_interval)
+            self.forward_now.clear()
+            with self.lock:
+                batches = [(node, links) for node, links in self.outbox.items() if links]
+                for node, _ in batches:
+                    self.outbox[node] = list()
+                self.in_flight += len(batches)
+            for node, links in batches:
+                self._send(node, {"type": "links", "links": [
+                    (url, depth) for url, depth, _ in links]})
+                FORWARDED.inc(str(node), len(links))
+                with self.lock:
+                    self._sent(links)
+                    self.in_flight -= 1
+                    self.sent += 1
+
+    def _send(self, node, message):
+        ''' Sends message to node, retrying until it is up. '''
+        delay = 0.1
+        while True:
+            try:
+                return self.peers[node].request(message)
+            except OSError as error:
+                self.logger.warning(f"{error}, retrying in {delay:.1f}s.")
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    def _detect_termination(self):
+        last = None
+        while not self.stopped:
+            time.sleep(self.config.forward_interval)
+            statuses = [self.status()]
+            try:
+                statuses += [peer.request({"type": "status"}) for peer in self.peers.values()]
+            except OSError:
+                last = None
+                continue
+            counts = (sum(status["sent"] for status in statuses),
+                      sum(status["received"] for status in statuses))
+            if not all(status["idle"] for status in statuses) or counts[0] != counts[1]:
+                last = None
+            elif counts != last:
+                last = counts
+            else:
+                self.logger.info("Every node is idle, stopping the crawl.")
+                for node in self.peers:
+                    self._send(node, {"type": "stop"})
+                self.stop()
+
+    def close(self):
+        if getattr(self, "server", None) is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            for peer in self.peers.values():
+                peer.close()
+        super().close()
@@ -1,19 +1,88 @@
+import itertools
 import os
-import shelve
 import requests
 import re
+import time
 from bs4 import BeautifulSoup
-from threading import Thread, RLock
+from heapq import heapify, heappush, heappop
+from threading import Thread, RLock, Condition
 from queue import Queue, Empty
+from urllib.parse import urlparse, urljoin
 
 from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils.metrics import metrics
+from utils.seen import SeenSet
+from crawler.store import get_store
+from crawler.robots import RobotsCache
+from crawler.recrawl import FetchLog, NEW
+from crawler.checkpoint import Checkpoint, UNCHECKED
+from scraper import is_valid, traps
+
+# Weights of the url priority (lower is fetched first): one link further
+# from the seeds costs 1, a host or template whose pages were all useless
+# costs HOST_WEIGHT or TEMPLATE_WEIGHT more.
+HOST_WEIGHT = 2.0
+TEMPLATE_WEIGHT = 4.0
+# Longer redirect chains are treated like loops.
+MAX_REDIRECTS = 5
+
+REDIRECTS = metrics.counter(
+    "redirects", "Redirected fetches: followed by the cache server, a 3xx "
+    "Location left to the crawler, or a loop.", "outcome")
+
+
+def redirect_chain(url, resp):
+    ''' The normalized urls a fetch of url went through, url first and the
+    page it ended on last: the history and final url of a redirect the
+    cache server followed, or the Location of a 3xx response it did not. '''
+    raw = resp.raw_response
+    if raw is None:
+        return [url]
+    if 300 <= resp.status < 400:
+        location = raw.headers.get("Location")
+        hops = [urljoin(raw.url or url, location)] if location else []
+    else:
+        # history[0] is the request for url itself.
+        hops = [hop.url for hop in (raw.history or ())[1:] if hop.url]
+        if raw.url:
+            hops.append(raw.url)
+    chain = [url]
+    for hop in hops:
+        hop = normalize(hop)
+        if hop != chain[-1]:
+            chain.append(hop)
+    return chain
+
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        # One heap of (priority, seq, url, depth) per host (netloc). A host
+        # with queued urls and no worker fetching it sits on waiting_hosts, a
+        # heap of (time it may be fetched again, host), until its politeness
+        # window is over, and then on ready_hosts, a heap of (priority of its
+        # best url, token, host). ready_tokens holds the current token of
+        # each ready host; entries with an older token are stale and skipped.
+        self.host_queues = dict()
+        self.waiting_hosts = list()
+        self.ready_hosts = list()
+        self.ready_tokens = dict()
+        self.busy_hosts = set()
+        self.next_fetch = dict()
+        self.in_progress = 0
+        # Depth of each url being fetched, for the links found on it.
+        self.depths = dict()
+        # Completed urls queued again by a recrawl.
+        self.revisits = set()
+        # Queued urls that turned out to be redirect aliases or targets
+        # whose page was already downloaded; dropped when popped.
+        self.aliases = set()
+        self.counter = itertools.count()
+        # Every url ever added, so add_url never has to ask the save file.
+        self.seen = SeenSet(bloom_bits=self.config.bloom_bits)
+        self.lock = RLock()
+        self.has_work = Condition(self.lock)
         
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -24,53 +93,346 @@ class Frontier(object):
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = get_store(self.config, restart)
+        # url -> the url it redirects to, at the end of its chain.
+        self.redirects = dict(self.save.redirects())
+        self.robots = RobotsCache(
+            self.config.robots_file, self.config.user_agent,
+            self.config.robots_ttl, restart)
+        self.fetches = FetchLog(
+            self.config.fetches_file, restart,
+            default_interval=self.config.revisit_default,
+            min_interval=self.config.revisit_min,
+            max_interval=self.config.revisit_max,
+            flush_size=self.config.flush_size,
+            flush_interval=self.config.flush_interval)
+        self.checkpoint = Checkpoint(
+            self.config.checkpoint_file, restart,
+            flush_size=self.config.flush_size,
+            flush_interval=self.config.flush_interval,
+            compact_size=self.config.checkpoint_size)
         if restart:
+            self.checkpoint.write(self.seen, [])
             for url in self.config.seed_urls:
                 self.add_url(url)
-        else:
+        elif not self._resume():
             # Set the frontier state with contents of save file.
             self._parse_save_file()
+            self._write_checkpoint()
             if not self.save:
                 for url in self.config.seed_urls:
                     self.add_url(url)
 
+    def _resume(self):
+        ''' Sets the frontier state from the checkpoint, which leaves
+        validating the queued urls to get_tbd_url. Returns False if there is
+        no checkpoint that matches the save file, or if a recrawl has to look
+        at the completed urls too. '''
+        if self.config.recrawl:
+            return False
+        total_count = len(self.save)
+        state = self.checkpoint.load(total_count, self.config.bloom_bits)
+        if state is None:
+            return False
+        self.seen, queues, tail = state
+        with self.lock:
+            for host, queue in queues:
+                self.host_queues[host] = queue
+            self.waiting_hosts = [(0, host) for host in self.host_queues]
+            heapify(self.waiting_hosts)
+            # Urls found since the snapshot are unchecked too, and come
+            # after it.
+            unchecked = itertools.count(
+                UNCHECKED + sum(len(queue) for _, queue in queues))
+            for url, depth, priority in tail:
+                self._enqueue(url, depth, priority, next(unchecked))
+        self.logger.info(
+            f"Resumed {len(self)} urls to be downloaded from {total_count} "
+            f"total urls discovered, from checkpoint {self.config.checkpoint_file}.")
+        return True
+
     def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
+        ''' This function can be overridden for alternate saving techniques.
+        Rows of save files written before urls were canonicalized (see
+        utils/canonical.py) are keyed by the hash of the url as it was found;
+        they are moved under the hash of the canonical url, merged with any
+        row already there, so completing the url updates them. '''
         total_count = len(self.save)
         tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        due = set(self.fetches.due_urls()) if self.config.recrawl else ()
+        stale = list()
+
+        def scan(urlhash, url, completed, depth):
+            # A url whose digest is in self.seen already is queued already.
+            if not self.seen.add_digest(SeenSet.hash_digest(urlhash)):
+                return 0
+            if (not completed or url in due) and is_valid(url):
+                self._enqueue(url, depth)
+                if completed:
+                    self.revisits.add(url)
+                return 1
+            return 0
+
+        with self.lock:
+            for urlhash, (url, completed, depth) in self.save.items():
+                key = get_urlhash(url)
+                if key != urlhash:
+                    stale.append((urlhash, key, normalize(url), completed, depth))
+                else:
+                    tbd_count += scan(urlhash, url, completed, depth)
+            if stale:
+                for row in self.save.rekey(stale):
+                    tbd_count += scan(*row)
+                self.logger.info(
+                    f"Moved {len(stale)} urls of an older save file under their canonical urls.")
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+            f"total urls discovered"
+            + (f", {len(self.revisits)} of them due for a revisit." if self.config.recrawl else "."))
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(queue) for queue in self.host_queues.values())
+
+    def priority(self, url, depth):
+        ''' Lower is better: shallow urls on hosts and templates whose pages
+        have been useful so far come first. '''
+        host_bad, template_bad = traps.suspicion(url)
+        return depth + HOST_WEIGHT * host_bad + TEMPLATE_WEIGHT * template_bad
+
+    def _enqueue(self, url, depth, priority=None, seq=None):
+        host = urlparse(url).netloc
+        if priority is None:
+            priority = self.priority(url, depth)
+        queue = self.host_queues.get(host)
+        if queue is None:
+            queue = self.host_queues[host] = list()
+            if host not in self.busy_hosts:
+                heappush(self.waiting_hosts, (self.next_fetch.get(host, 0), host))
+        elif host in self.ready_tokens and priority < queue[0][0]:
+            self._make_ready(host, priority)
+        if seq is None:
+            seq = next(self.counter)
+        heappush(queue, (priority, seq, url, depth))
+        self.has_work.notify()
+
+    def _make_ready(self, host, priority):
+        token = next(self.counter)
+        self.ready_tokens[host] = token
+        heappush(self.ready_hosts, (priority, token, host))
 
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        ''' Blocks until some host is out of its politeness window. Returns
+        None only once every queue is empty and no worker is still fetching
+        (and so could still discover new urls), or once the frontier is
+        closed. '''
+        with self.has_work:
+            while True:
+                if self.closed:
+                    return None
+                now = time.monotonic()
+                while self.waiting_hosts and self.waiting_hosts[0][0] <= now:
+                    _, host = heappop(self.waiting_hosts)
+                    self._make_ready(host, self.host_queues[host][0][0])
+                while self.ready_hosts:
+                    _, token, host = heappop(self.ready_hosts)
+                    if self.ready_tokens.get(host) != token:
+                        continue
+                    del self.ready_tokens[host]
+                    queue = self.host_queues[host]
+                    _, seq, url, depth = heappop(queue)
+                    alias = url in self.aliases
+                    if alias or (seq < 0 and not is_valid(url)):
+                        # The page of an alias came with a redirect. A url
+                        # from a checkpoint was queued by an earlier run,
+                        # maybe under other rules, so it is only checked now.
+                        # Neither is fetched and neither waits.
+                        if alias:
+                            self.aliases.discard(url)
+                            self._complete(url)
+                        if queue:
+                            self._make_ready(host, queue[0][0])
+                        else:
+                            del self.host_queues[host]
+                        continue
+                    if not queue:
+                        del self.host_queues[host]
+                    self.busy_hosts.add(host)
+                    self.in_progress += 1
+                    self.depths[url] = depth
+                    return url
+                if self.waiting_hosts:
+                    self.has_work.wait(self.waiting_hosts[0][0] - now)
+                elif self.in_progress:
+                    self.has_work.wait()
+                elif self.idle():
+                    self.save.flush()
+                    self.checkpoint.flush()
+                    self.has_work.notify_all()
+                    return None
+
+    def idle(self):
+        ''' Called by get_tbd_url, with the lock held, once nothing is queued
+        or being fetched. Returns True to stop the workers; an override may
+        wait for urls from elsewhere and return False to look again. '''
+        return True
 
-    def add_url(self, url):
+    def add_url(self, url, parent=None):
+        ''' Queues url one link deeper than parent, the url it was found on
+        (a seed if None). Does nothing once the frontier is closed. '''
+        if self.closed:
+            return
         url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
+        if self.robots.allowed(url) is False:
+            # Hosts whose robots.txt is not known yet are checked by the
+            # worker when the url is popped.
+            return
+        digest = self.seen.digest(url)
+        with self.lock:
+            if not self.closed and self.seen.add_digest(digest):
+                self._add(url, self._depth(url, parent), digest)
+
+    def _depth(self, url, parent):
+        depth = self.depths.get(parent, -1) + 1
+        if parent is not None and self.redirects.get(parent) == url:
+            # The page parent redirects to is no further from the seeds.
+            depth -= 1
+        return depth
+
+    def _add(self, url, depth, digest):
+        # url is new to self.seen, under digest.
+        priority = self.priority(url, depth)
+        self.save.add(get_urlhash(url), url, depth)
+        self.checkpoint.add(url, depth, priority, digest)
+        self._enqueue(url, depth, priority)
     
+    def fetched(self, url, resp):
+        ''' Logs the download of url and the redirects it went through.
+        Returns NEW unless url is a revisit, then CHANGED or UNCHANGED (see
+        crawler/recrawl.py). '''
+        if self.closed:
+            return NEW
+        change = self.fetches.record(url, resp)
+        chain = redirect_chain(url, resp)
+        if len(chain) > 1:
+            with self.lock:
+                self._record_redirects(chain, followed=not 300 <= resp.status < 400)
+        return change if url in self.revisits else NEW
+
+    def _record_redirects(self, chain, followed):
+        ''' Maps every url of chain to the last one, or to where that one
+        was found to redirect before. If the cache server followed the
+        redirects, the page of every url after the first is in hand, so they
+        are marked complete and never fetched themselves. A 3xx target is
+        left to the scraper, which returns it as a link.
+
+        A chain that repeats a url, or that leads back into itself through
+        redirects recorded earlier, or that is longer than MAX_REDIRECTS, is
+        a loop: nothing is mapped and none of its urls is fetched again. '''
+        source, target = chain[0], chain[-1]
+        hops = set(chain)
+        loop = len(hops) < len(chain) or len(chain) > MAX_REDIRECTS + 1
+        while not loop and target in self.redirects:
+            target = self.redirects[target]
+            loop = target in hops or len(hops) > MAX_REDIRECTS
+            hops.add(target)
+        if loop:
+            self.logger.warning(f"Redirect loop from {source}: {' -> '.join(chain)}")
+            REDIRECTS.inc("loop")
+            for url in hops - {source}:
+                self._mark_alias(url, source)
+            return
+        REDIRECTS.inc("followed" if followed else "location")
+        for url in chain[:-1]:
+            self.redirects[url] = target
+            self.save.add_redirect(get_urlhash(url), url, target)
+        if followed:
+            for url in chain[1:]:
+                self._mark_alias(url, source)
+
+    def _mark_alias(self, url, source):
+        ''' Marks url complete since it need not be fetched, and drops it
+        when it is popped if it was queued already. '''
+        if not is_valid(url):
+            return
+        digest = self.seen.digest(url)
+        if self.seen.add_digest(digest):
+            depth = self.depths.get(source, 0)
+            self.save.add(get_urlhash(url), url, depth)
+            self.checkpoint.add(url, depth, self.priority(url, depth), digest)
+        else:
+            self.aliases.add(url)
+        self._complete(url)
+
+    def _complete(self, url):
+        self.save.complete(get_urlhash(url), url)
+        self.checkpoint.complete(url)
+
     def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        host = urlparse(url).netloc
+        with self.lock:
+            if self.closed:
+                return
+            if url not in self.seen:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            self._complete(url)
+            self.depths.pop(url, None)
+            self.revisits.discard(url)
+            if self.checkpoint.due:
+                self._write_checkpoint()
+
+            # The politeness window starts once the fetch is done, so two
+            # workers never hit the same host closer than time_delay apart.
+            self.next_fetch[host] = time.monotonic() + self.config.time_delay
+            if host in self.busy_hosts:
+                self.busy_hosts.discard(host)
+                self.in_progress -= 1
+                if host in self.host_queues:
+                    heappush(self.waiting_hosts, (self.next_fetch[host], host))
+            self.has_work.notify_all()
+
+    def _write_checkpoint(self):
+        ''' Snapshots the queued urls and the ones being fetched, but not the
+        completed ones queued again (aliases and revisits). '''
+        with self.lock:
+            skip = self.aliases | self.revisits
+            queues = dict()
+            for host, queue in self.host_queues.items():
+                if skip:
+                    queue = [entry for entry in queue if entry[2] not in skip]
+                    heapify(queue)
+                else:
+                    # A copy, since the urls being fetched are pushed below.
+                    queue = list(queue)
+                queues[host] = queue
+            for url, depth in self._unfinished():
+                if url not in skip:
+                    entry = (self.priority(url, depth), 0, url, depth)
+                    heappush(queues.setdefault(urlparse(url).netloc, list()), entry)
+            self.checkpoint.write(self.seen, queues.items())
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+    def _unfinished(self):
+        ''' (url, depth) of the urls handed out and not completed yet. '''
+        return self.depths.items()
 
+    @property
+    def closed(self):
+        return self.save is None
 
+    def close(self):
+        ''' Writes a checkpoint and closes the save file and the other
+        stores. Call it once the workers are done; a second call, and
+        add_url or mark_url_complete after it, do nothing. '''
+        with self.lock:
+            if self.save is not None:
+                self._write_checkpoint()
+                self.checkpoint.close()
+                self.save.close()
+                self.robots.close()
+                self.fetches.close()
+                self.save = None
+                self.has_work.notify_all()
@@ -0,0 +1,135 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from queue import Queue
+from threading import Thread
+
+import scraper
+from crawler import Crawler
+from crawler.worker import Worker, WAIT_TIME, ADD_TIME, COMPLETE_TIME
+from crawler.recrawl import CHANGED, UNCHANGED
+from utils import get_logger
+from utils.canonical import configure as configure_canonical
+from utils.logs import logs, forward_to
+
+
+def start_parser(log_queue, level, events, keep_anchors, strip_params):
+    ''' Initializer of a parser process: logs through the crawler process,
+    canonicalizes urls like it (STRIPPARAMS) and keeps anchor text if the
+    crawler records the link graph. '''
+    forward_to(log_queue, level, events)
+    configure_canonical(strip_params)
+    scraper.keep_anchors = keep_anchors
+
+
+class DownloadWorker(Worker):
+    ''' Fetches urls and hands the responses to the parser processes. The url
+    stays in progress in the frontier (keeping its host's politeness window
+    closed) until the Coordinator has applied the parse result. '''
+    def __init__(self, worker_id, config, frontier, parsers, results):
+        super().__init__(worker_id, config, frontier)
+        self.parsers = parsers
+        self.results = results
+
+    def run(self):
+        while True:
+            with WAIT_TIME.time():
+                tbd_url = self.frontier.get_tbd_url()
+            if not tbd_url:
+                self.logger.info("Frontier is empty. Stopping Crawler.")
+                break
+            try:
+                if not scraper.should_scrape(tbd_url):
+                    self.results.put((tbd_url, None, None))
+                    continue
+                if not self.robots_allowed(tbd_url):
+                    self.logger.info(f"Disallowed by robots.txt: {tbd_url}")
+                    self.results.put((tbd_url, None, None))
+                    continue
+                resp = self.fetch(tbd_url)
+                change = self.frontier.fetched(tbd_url, resp)
+                if change == UNCHANGED:
+                    self.logger.info(f"Unchanged since the last crawl: {tbd_url}")
+                    self.results.put((tbd_url, None, None))
+                    continue
+                rejected = scraper.prescreen(tbd_url, resp)
+                if rejected is not None:
+                    # Binaries and huge pages are not sent to a parser.
+                    future = Future()
+                    future.set_result(rejected)
+                else:
+                    future = self.parsers.submit(scraper.parse_page, tbd_url, resp)
+                future.add_done_callback(
+                    lambda done, url=tbd_url, change=change:
+                        self.results.put((url, done, change)))
+            except Exception:
+                self.logger.exception(f"Failed to download {tbd_url}.")
+                self.results.put((tbd_url, None, None))
+
+
+class Coordinator(Thread):
+    ''' The single thread that applies parse results: the near-duplicate
+    check and statistics in scraper.record_page, then the frontier update.
+    Keeping this in one place keeps the dedup state consistent no matter
+    how many parser processes run. '''
+    def __init__(self, frontier, results):
+        self.logger = get_logger("Coordinator", "Worker")
+        self.frontier = frontier
+        self.results = results
+        super().__init__(daemon=True)
+
+    def run(self):
+        while True:
+            item = self.results.get()
+            if item is None:
+                scraper.stats.flush()
+                scraper.traps.flush()
+                scraper.link_graph.flush()
+                break
+            url, future, change = item
+            try:
+                if future is not None:
+                    # A changed revisit only contributes its links.
+                    record = (scraper.record_revisit if change == CHANGED
+                              else scraper.record_page)
+                    scraped_urls = record(url, future.result())
+                    with ADD_TIME.time():
+                        for scraped_url in scraped_urls:
+                            self.frontier.add_url(scraped_url, parent=url)
+            except Exception:
+                self.logger.exception(f"Failed to parse {url}.")
+            with COMPLETE_TIME.time():
+                self.frontier.mark_url_complete(url)
+
+
+class PipelineCrawler(Crawler):
+    ''' Download threads -> parser processes -> one coordinator thread, used
+    when PARSERS is set in the config. Parsing runs outside the GIL, so the
+    crawl can use every core while the frontier still enforces politeness. '''
+    def start_async(self):
+        self.results = Queue()
+        # spawn, not fork: the download threads are already running (and
+        # holding locks) when the pool starts its processes.
+        context = multiprocessing.get_context("spawn")
+        # The parsers' log records and events are written by this process.
+        self.log_queue = context.Queue()
+        self.log_listener = logs.listen(self.log_queue)
+        self.parsers = ProcessPoolExecutor(
+            self.config.parser_processes, mp_context=context,
+            initializer=start_parser,
+            initargs=(self.log_queue, logs.level, bool(self.config.events_file),
+                      scraper.keep_anchors, self.config.strip_params))
+        self.coordinator = Coordinator(self.frontier, self.results)
+        self.workers = [
+            DownloadWorker(
+                worker_id, self.config, self.frontier, self.parsers, self.results)
+            for worker_id in range(self.config.threads_count)]
+        self.coordinator.start()
+        for worker in self.workers:
+            worker.start()
+
+    def join(self):
+        super().join()
+        self.results.put(None)
+        self.coordinator.join()
+        self.parsers.shutdown()
+        self.log_listener.stop()
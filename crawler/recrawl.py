@@ -0,0 +1,159 @@
+import hashlib
+import math
+import os
+import sqlite3
+import time
+from threading import RLock
+from urllib.parse import urlparse
+
+from utils.stats import to_signed
+
+# What FetchLog.record found out about a fetch.
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+
+def content_digest(content):
+    ''' 64-bit digest of the raw page bytes. '''
+    return int.from_bytes(hashlib.blake2b(content, digest_size=8).digest(), "big")
+
+
+class FetchLog(object):
+    ''' The last fetch of every url: status, time, a digest of the content
+    and the ETag/Last-Modified headers, kept in an SQLite file next to the
+    frontier save file. Per host it counts revisits, how many of them found
+    the page changed and the time between them, from which due_urls()
+    estimates how often the host's pages change and which completed urls
+    are worth fetching again.
+
+    Fetches are buffered like the frontier store and written every
+    flush_size fetches or flush_interval seconds. '''
+
+    def __init__(self, path, restart=False, default_interval=86400,
+                 min_interval=3600, max_interval=30 * 86400,
+                 flush_size=1000, flush_interval=5.0):
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.lock = RLock()
+        if restart:
+            for name in (path, path + "-wal", path + "-shm"):
+                if os.path.exists(name):
+                    os.remove(name)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fetches ("
+            "url TEXT PRIMARY KEY, host TEXT NOT NULL, status INTEGER, "
+            "fetched REAL NOT NULL, digest INTEGER, etag TEXT, "
+            "last_modified TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS hosts ("
+            "host TEXT PRIMARY KEY, revisits INTEGER NOT NULL, "
+            "changes INTEGER NOT NULL, elapsed REAL NOT NULL)")
+        self.db.commit()
+        # host -> [revisits, changes, seconds between the visits in total]
+        self.hosts = {
+            host: [revisits, changes, elapsed]
+            for host, revisits, changes, elapsed in self.db.execute(
+                "SELECT host, revisits, changes, elapsed FROM hosts")}
+        # url -> fetches row not yet written to the database.
+        self.pending = dict()
+        self.last_flush = time.monotonic()
+
+    def _last_fetch(self, url):
+        row = self.pending.get(url)
+        if row is None:
+            row = self.db.execute(
+                "SELECT url, host, status, fetched, digest, etag, last_modified "
+                "FROM fetches WHERE url = ?", (url,)).fetchone()
+        return row
+
+    def record(self, url, resp):
+        ''' Logs a fetch of url and returns NEW if it was never fetched
+        before, else CHANGED or UNCHANGED. A page is unchanged if it has the
+        same status and the same ETag, Last-Modified or content digest. '''
+        host = urlparse(url).netloc
+        etag = last_modified = None
+        raw = resp.raw_response
+        if raw is not None:
+            etag = raw.headers.get("ETag")
+            last_modified = raw.headers.get("Last-Modified")
+        now = time.time()
+        with self.lock:
+            last = self._last_fetch(url)
+            if (last is not None and last[2] == resp.status
+                    and ((etag and etag == last[5])
+                         or (last_modified and last_modified == last[6]))):
+                # The validators match, so the content need not be hashed.
+                digest = last[4]
+            else:
+                digest = to_signed(content_digest(resp.body)) if raw is not None else None
+            self.pending[url] = (
+                url, host, resp.status, now, digest, etag, last_modified)
+            if last is None:
+                outcome = NEW
+            else:
+                outcome = (UNCHANGED if last[2] == resp.status and last[4] == digest
+                           else CHANGED)
+                counts = self.hosts.setdefault(host, [0, 0, 0.0])
+                counts[0] += 1
+                counts[1] += outcome == CHANGED
+                counts[2] += now - last[3]
+            if (len(self.pending) >= self.flush_size
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self.flush()
+        return outcome
+
+    def interval(self, host):
+        ''' Seconds after which a page of host is due for another fetch.
+
+        With n revisits, X of which found a change, and mean time I between
+        visits, the change rate is estimated as -log((n - X + 0.5) / (n + 0.5)) / I
+        (Cho and Garcia-Molina), which unlike X / n does not saturate
+        once every revisit finds a change. A page is due after 1 / rate. '''
+        counts = self.hosts.get(host)
+        if not counts or not counts[0]:
+            return self.default_interval
+        revisits, changes, elapsed = counts
+        rate = -math.log((revisits - changes + 0.5) / (revisits + 0.5)) / (elapsed / revisits or 1)
+        interval = 1 / rate if rate > 0 else self.max_interval
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def due_urls(self):
+        ''' Yields every logged url whose host's interval has passed since
+        its last fetch. '''
+        self.flush()
+        now = time.time()
+        intervals = dict()
+        for url, host, fetched in self.db.execute(
+                "SELECT url, host, fetched FROM fetches"):
+            interval = intervals.get(host)
+            if interval is None:
+                interval = intervals[host] = self.interval(host)
+            if now - fetched >= interval:
+                yield url
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                with self.db:
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO fetches (url, host, status, "
+                        "fetched, digest, etag, last_modified) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", self.pending.values())
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO hosts (host, revisits, "
+                        "changes, elapsed) VALUES (?, ?, ?, ?)",
+                        ((host, *counts) for host, counts in self.hosts.items()))
+                self.pending.clear()
+            self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.db.close()
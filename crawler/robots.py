@@ -0,0 +1,140 @@
+import os
+import re
+import sqlite3
+import time
+from threading import RLock
+from urllib.parse import urlparse
+
+from lxml import etree
+
+
+class RobotRules(object):
+    ''' The Allow/Disallow rules of one robots.txt that apply to our user
+    agent, sorted longest first so the first match is the most specific one
+    (ties go to Allow). Plain prefixes are checked with startswith, only
+    rules with * or $ are compiled to regexes. '''
+
+    def __init__(self, body, user_agent):
+        self.sitemaps = list()
+        groups = dict()
+        agents = list()
+        in_rules = False
+        for line in body.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            field, value = line.split(":", 1)
+            field, value = field.strip().lower(), value.strip()
+            if field == "user-agent":
+                if in_rules:
+                    agents = list()
+                    in_rules = False
+                agents.append(value.lower())
+            elif field in ("allow", "disallow"):
+                in_rules = True
+                for agent in agents:
+                    groups.setdefault(agent, list()).append((field == "allow", value))
+            elif field == "sitemap":
+                self.sitemaps.append(value)
+        rules = self._group_for(groups, user_agent.lower())
+        self.rules = sorted(
+            (self._compile(allow, path) for allow, path in rules if path or allow),
+            key=lambda rule: (-rule[0], not rule[1]))
+
+    @staticmethod
+    def _group_for(groups, user_agent):
+        for agent, rules in groups.items():
+            if agent != "*" and agent in user_agent.split():
+                return rules
+        return groups.get("*", list())
+
+    @staticmethod
+    def _compile(allow, path):
+        if "*" in path or path.endswith("$"):
+            anchored = path.endswith("$")
+            pattern = ".*".join(re.escape(part) for part in path.rstrip("$").split("*"))
+            return len(path), allow, re.compile(pattern + ("$" if anchored else "")).match
+        return len(path), allow, path
+
+    def allowed(self, path):
+        for _, allow, rule in self.rules:
+            if (path.startswith(rule) if isinstance(rule, str) else rule(path)):
+                return allow
+        return True
+
+
+def robots_url(url):
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+
+
+def parse_sitemap(content):
+    ''' Returns (page urls, nested sitemap urls) listed in a sitemap or
+    sitemap index. '''
+    urls, sitemaps = list(), list()
+    try:
+        root = etree.fromstring(content)
+    except (etree.XMLSyntaxError, ValueError):
+        return urls, sitemaps
+    nested = etree.QName(root).localname == "sitemapindex"
+    for element in root.iter("{*}loc"):
+        if element.text:
+            (sitemaps if nested else urls).append(element.text.strip())
+    return urls, sitemaps
+
+
+class RobotsCache(object):
+    ''' Compiled robots.txt rules per host. The raw files are kept in an
+    SQLite file next to the frontier save file and expire after ttl seconds,
+    so a restarted crawl does not refetch them. '''
+
+    def __init__(self, path, user_agent, ttl, restart=False):
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.lock = RLock()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS robots ("
+            "host TEXT PRIMARY KEY, fetched REAL NOT NULL, body TEXT NOT NULL)")
+        self.db.commit()
+        # host -> (time fetched, RobotRules)
+        self.hosts = {
+            host: (fetched, RobotRules(body, user_agent))
+            for host, fetched, body in self.db.execute(
+                "SELECT host, fetched, body FROM robots")}
+
+    def rules(self, host):
+        ''' The rules for host, or None if they were never fetched or expired. '''
+        with self.lock:
+            entry = self.hosts.get(host)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def allowed(self, url):
+        ''' True or False, or None if the host's robots.txt must be fetched first. '''
+        parsed = urlparse(url)
+        rules = self.rules(parsed.netloc)
+        if rules is None:
+            return None
+        path = parsed.path or "/"
+        return rules.allowed(f"{path}?{parsed.query}" if parsed.query else path)
+
+    def add(self, host, body):
+        ''' Compiles and stores the robots.txt body fetched for host. An empty
+        body (missing or unreadable robots.txt) allows everything. '''
+        rules = RobotRules(body, self.user_agent)
+        fetched = time.time()
+        with self.lock:
+            self.hosts[host] = (fetched, rules)
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO robots (host, fetched, body) "
+                    "VALUES (?, ?, ?)", (host, fetched, body))
+        return rules
+
+    def close(self):
+        with self.lock:
+            self.db.close()
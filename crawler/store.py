@@ -0,0 +1,253 @@
+import os
+import shelve
+import sqlite3
+import time
+
+from utils.metrics import metrics
+
+FLUSH_TIME = metrics.histogram("store_flush_seconds", "Writing buffered urls to the save file.")
+
+
+class ShelveStore(object):
+    ''' The original shelve save file, keyed by urlhash with (url, completed,
+    depth) values, and a second shelve of redirects. Writes are synced in
+    batches instead of once per url. '''
+    def __init__(self, path, flush_size=1000, flush_interval=5.0):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.save = shelve.open(path)
+        self.redirect_save = shelve.open(path + ".redirects")
+        self.dirty = 0
+        self.last_flush = time.monotonic()
+
+    def __contains__(self, urlhash):
+        return urlhash in self.save
+
+    def __len__(self):
+        return len(self.save)
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def items(self):
+        ''' Yields (urlhash, (url, completed, depth)) of every url. '''
+        for urlhash, value in self.save.items():
+            # Save files from before depth was kept hold (url, completed).
+            yield urlhash, value if len(value) == 3 else (*value, 0)
+
+    def rekey(self, moves):
+        ''' Moves rows saved under another urlhash, (old urlhash, urlhash,
+        url, completed, depth), merging them with a row already at urlhash.
+        Returns the merged rows, (urlhash, url, completed, depth). '''
+        merged = dict()
+        for old, urlhash, url, completed, depth in moves:
+            del self.save[old]
+            row = self.save.get(urlhash)
+            if row is not None:
+                completed = completed or row[1]
+                depth = min(depth, row[2] if len(row) == 3 else 0)
+            merged[urlhash] = self.save[urlhash] = (url, completed, depth)
+        self.flush()
+        return [(urlhash, *row) for urlhash, row in merged.items()]
+
+    def add(self, urlhash, url, depth=0):
+        self.save[urlhash] = (url, False, depth)
+        self._wrote()
+
+    def complete(self, urlhash, url):
+        self.save[urlhash] = (url, True, 0)
+        self._wrote()
+
+    def redirects(self):
+        return self.redirect_save.values()
+
+    def add_redirect(self, urlhash, url, target):
+        self.redirect_save[urlhash] = (url, target)
+        self._wrote()
+
+    def _wrote(self):
+        self.dirty += 1
+        if (self.dirty >= self.flush_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with FLUSH_TIME.time():
+            self.save.sync()
+            self.redirect_save.sync()
+        self.dirty = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.save.close()
+        self.redirect_save.close()
+
+    @staticmethod
+    def files(path):
+        # dbm backends may add their own suffixes to the save file.
+        return [name + ext for name in (path, path + ".redirects")
+                for ext in ("", ".db", ".dat", ".dir", ".bak")]
+
+
+class SQLiteStore(object):
+    ''' SQLite in WAL mode. Adds and completions are buffered in memory and
+    written in one transaction once flush_size writes are pending or
+    flush_interval seconds have passed. A crash loses at most the unflushed
+    buffer; SQLite replays the committed WAL on the next open. '''
+    def __init__(self, path, flush_size=1000, flush_interval=5.0):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL DEFAULT 0, "
+            "depth INTEGER NOT NULL DEFAULT 0)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS redirects ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, target TEXT NOT NULL)")
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(urls)")]
+        if "depth" not in columns:
+            self.db.execute(
+                "ALTER TABLE urls ADD COLUMN depth INTEGER NOT NULL DEFAULT 0")
+        self.db.commit()
+        self.count = self.db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        # urlhash -> (url, completed, depth) not yet written to the database,
+        # and the same for (url, redirect target).
+        self.pending = dict()
+        self.pending_redirects = dict()
+        self.last_flush = time.monotonic()
+
+    def __contains__(self, urlhash):
+        if urlhash in self.pending:
+            return True
+        return self.db.execute(
+            "SELECT 1 FROM urls WHERE urlhash = ?", (urlhash,)
+            ).fetchone() is not None
+
+    def __len__(self):
+        return self.count
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def items(self):
+        ''' Yields (urlhash, (url, completed, depth)) of every url. '''
+        self.flush()
+        for urlhash, url, completed, depth in self.db.execute(
+                "SELECT urlhash, url, completed, depth FROM urls"):
+            yield urlhash, (url, bool(completed), depth)
+
+    def rekey(self, moves):
+        ''' Moves rows saved under another urlhash, (old urlhash, urlhash,
+        url, completed, depth), merging them with a row already at urlhash.
+        Returns the merged rows, (urlhash, url, completed, depth). '''
+        self.flush()
+        with self.db:
+            for old, urlhash, url, completed, depth in moves:
+                self.db.execute("DELETE FROM urls WHERE urlhash = ?", (old,))
+                self.db.execute(
+                    "INSERT INTO urls (urlhash, url, completed, depth) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT(urlhash) DO UPDATE SET "
+                    "completed = MAX(completed, excluded.completed), "
+                    "depth = MIN(depth, excluded.depth)",
+                    (urlhash, url, int(completed), depth))
+        self.count = self.db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        merged = list()
+        for urlhash in dict.fromkeys(move[1] for move in moves):
+            url, completed, depth = self.db.execute(
+                "SELECT url, completed, depth FROM urls WHERE urlhash = ?",
+                (urlhash,)).fetchone()
+            merged.append((urlhash, url, bool(completed), depth))
+        return merged
+
+    def add(self, urlhash, url, depth=0):
+        if urlhash not in self.pending:
+            self.count += 1
+        self.pending[urlhash] = (url, False, depth)
+        self._wrote()
+
+    def complete(self, urlhash, url):
+        depth = self.pending[urlhash][2] if urlhash in self.pending else 0
+        self.pending[urlhash] = (url, True, depth)
+        self._wrote()
+
+    def redirects(self):
+        ''' Yields (url, target) of every redirect recorded. '''
+        self.flush()
+        yield from self.db.execute("SELECT url, target FROM redirects")
+
+    def add_redirect(self, urlhash, url, target):
+        self.pending_redirects[urlhash] = (url, target)
+        self._wrote()
+
+    def _wrote(self):
+        if (len(self.pending) + len(self.pending_redirects) >= self.flush_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            with FLUSH_TIME.time(), self.db:
+                self.db.executemany(
+                    "INSERT INTO urls (urlhash, url, completed, depth) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT(urlhash) DO UPDATE SET "
+                    "completed = MAX(completed, excluded.completed)",
+                    ((urlhash, url, int(completed), depth)
+                     for urlhash, (url, completed, depth) in self.pending.items()))
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO redirects (urlhash, url, target) "
+                    "VALUES (?, ?, ?)",
+                    ((urlhash, url, target)
+                     for urlhash, (url, target) in self.pending_redirects.items()))
+            self.pending.clear()
+            self.pending_redirects.clear()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    @staticmethod
+    def files(path):
+        return [path, path + "-wal", path + "-shm"]
+
+
+STORES = {"shelve": ShelveStore, "sqlite": SQLiteStore}
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+def detect_store(path):
+    ''' The backend of the save file at path, None if there is none yet. '''
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as save_file:
+            return "sqlite" if save_file.read(len(SQLITE_HEADER)) == SQLITE_HEADER else "shelve"
+    if any(os.path.exists(name) for name in ShelveStore.files(path)):
+        return "shelve"
+    return None
+
+
+def get_store(config, restart):
+    ''' Opens the save file with the configured backend, deleting any existing
+    one first if restart is set. Without STORE in the config, an existing save
+    file is opened with the backend that wrote it, and a new one is sqlite. '''
+    found = None if restart else detect_store(config.save_file)
+    if found and config.store and found != config.store:
+        raise ValueError(
+            f"Save file {config.save_file} was written by the {found} store, but "
+            f"STORE is {config.store}. Set STORE = {found} in [LOCAL PROPERTIES], "
+            f"or pass --restart to start over.")
+    store = STORES[config.store or found or "sqlite"]
+    if restart:
+        for path in store.files(config.save_file):
+            if os.path.exists(path):
+                os.remove(path)
+    return store(
+        config.save_file, flush_size=config.flush_size,
+        flush_interval=config.flush_interval)
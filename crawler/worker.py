@@ -1,11 +1,24 @@
+import time
 from threading import Thread
+from urllib.parse import urlparse
 
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.logs import logs
+from utils.metrics import metrics
 import scraper
-import time
-from scraper import visited_urls, all_hashes, subdomains, all_pages, all_words
+from crawler.robots import parse_sitemap, robots_url
+from crawler.recrawl import NEW, CHANGED
+
+WAIT_TIME = metrics.histogram("frontier_wait_seconds", "Time a worker waited for a url.")
+ROBOTS_TIME = metrics.histogram("robots_seconds", "robots.txt check, including fetching the file.")
+DOWNLOAD_TIME = metrics.histogram("download_seconds", "Download through the cache server.")
+SCRAPE_TIME = metrics.histogram("scrape_seconds", "scraper.scraper on a downloaded page.")
+ADD_TIME = metrics.histogram("frontier_add_seconds", "Adding the links of one page to the frontier.")
+COMPLETE_TIME = metrics.histogram("frontier_complete_seconds", "Marking a url complete.")
+FETCHES = metrics.counter("fetches", "Pages downloaded per host.", "host")
+RESPONSES = metrics.counter("responses", "Downloaded pages per status code.", "status")
 
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
@@ -19,50 +32,95 @@ class Worker(Thread):
         
     def run(self):
         while True:
-            print(len(self.frontier.to_be_downloaded))
-            tbd_url = self.frontier.get_tbd_url()
+            with WAIT_TIME.time():
+                tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
-                print(visited_urls, all_hashes , subdomains, all_pages, all_words)
+                # The report is read from the persisted stats: launch.py --report
+                scraper.stats.flush()
+                scraper.traps.flush()
+                scraper.link_graph.flush()
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                # if not (self.frontier.checkRatio() < 0.1 or self.frontier.getNumTokens() < 50):
-                self.frontier.add_url(scraped_url)
-            if scraped_urls:  # if this url is worth scraping, it is considered a valid scrape
-                with open("allurlsNEW.txt", "a") as x:
-                    x.write("New Scraped NEW NEW : " + tbd_url + "\n\n")
-                    print(f"done, length of scraped url: {len(scraped_urls)}")
-                # with open("allHashes.txt", "a") as y:
-                #     y.write("hashin.... keys: hash value\n")
-                #     for i in all_hashes:
-                #         y.write(f"{i}, {all_hashes[i]}\n")
-                #     y.write("\nDONE!")
-                #     y.write("\n")
-                # with open("all_subdomains.txt", "a") as z:
-                #     z.write("subdomains.... subdomain to number of pages on domain\n")
-                #     for i in subdomains:
-                #         z.write(f"{i}, {subdomains[i]}\n")
-                #     z.write("\nDONE!")
-                #     z.write("\n")
-                #
-                # with open("all_pages.txt", "a") as z:
-                #     z.write("ALL PAGES.... pages to num words\n")
-                #     for i in all_pages:
-                #         z.write(f"{i}, {all_pages[i]}\n")
-                #     z.write("\nDONE!")
-                #     z.write("\n")
-                #
-                # with open("all_words.txt", "a") as z:
-                #     z.write("ALL WORDS....words to count\n")
-                #     for i in all_words:
-                #         z.write(f"{i}, {all_words[i]}\n")
-                #     z.write("DONE!")
-                #     z.write("\n")
+            try:
+                if not scraper.should_scrape(tbd_url):
+                    # Skip the download of urls the scraper would reject anyway.
+                    scraped_urls = []
+                elif self.robots_allowed(tbd_url):
+                    resp = self.fetch(tbd_url)
+                    change = self.frontier.fetched(tbd_url, resp)
+                    if change == NEW:
+                        with SCRAPE_TIME.time():
+                            scraped_urls = scraper.scraper(tbd_url, resp)
+                    elif change == CHANGED:
+                        with SCRAPE_TIME.time():
+                            scraped_urls = scraper.rescrape(tbd_url, resp)
+                    else:
+                        self.logger.info(f"Unchanged since the last crawl: {tbd_url}")
+                        scraped_urls = []
+                else:
+                    self.logger.info(f"Disallowed by robots.txt: {tbd_url}")
+                    scraped_urls = []
+            except Exception:
+                # Always hand the url back, or the frontier keeps its host
+                # busy and the other workers wait on it forever.
+                self.logger.exception(f"Failed to download or scrape {tbd_url}.")
+                scraped_urls = []
+            with ADD_TIME.time():
+                for scraped_url in scraped_urls:
+                    # if not (self.frontier.checkRatio() < 0.1 or self.frontier.getNumTokens() < 50):
+                    self.frontier.add_url(scraped_url, parent=tbd_url)
+            # Politeness is enforced per host by the frontier.
+            with COMPLETE_TIME.time():
+                self.frontier.mark_url_complete(tbd_url)
+
+    def fetch(self, url):
+        ''' Downloads url, counting the response per host and status. '''
+        with DOWNLOAD_TIME.time():
+            resp = download(url, self.config, self.logger)
+        if metrics.enabled:
+            FETCHES.inc(urlparse(url).netloc)
+            RESPONSES.inc(resp.status)
+        logs.event("fetched", url, status=resp.status, size=resp.size)
+        self.logger.info(
+            f"Downloaded {url}, status <{resp.status}>, "
+            f"using cache {self.config.cache_server}.")
+        return resp
+
+    def robots_allowed(self, url):
+        ''' Checks url against its host's robots.txt, fetching the file (and
+        seeding the frontier from its sitemaps) the first time the host comes
+        up. The frontier keeps the host reserved for this worker meanwhile,
+        so each extra fetch waits out the politeness delay itself. '''
+        with ROBOTS_TIME.time():
+            return self._robots_allowed(url)
+
+    def _robots_allowed(self, url):
+        allowed = self.frontier.robots.allowed(url)
+        if allowed is not None:
+            return allowed
+        resp = download(robots_url(url), self.config, self.logger)
+        body = ""
+        if resp.status == 200 and resp.raw_response is not None:
+            body = resp.raw_response.content.decode("utf-8", "replace")
+        rules = self.frontier.robots.add(urlparse(url).netloc, body)
+        self.seed_sitemaps(rules.sitemaps)
+        time.sleep(self.config.time_delay)
+        return self.frontier.robots.allowed(url)
 
-            self.frontier.mark_url_complete(tbd_url)
+    def seed_sitemaps(self, sitemaps):
+        sitemaps = list(sitemaps)
+        read = 0
+        while sitemaps and read < self.config.max_sitemaps:
             time.sleep(self.config.time_delay)
+            resp = download(sitemaps.pop(0), self.config, self.logger)
+            read += 1
+            if resp.status != 200 or resp.raw_response is None:
+                continue
+            urls, nested = parse_sitemap(resp.raw_response.content)
+            sitemaps.extend(nested)
+            added = 0
+            for url in urls:
+                if scraper.is_valid(url):
+                    self.frontier.add_url(url)
+                    added += 1
+            self.logger.info(f"Seeded {added} urls from sitemap {resp.url}.")
@@ -4,14 +4,32 @@ from argparse import ArgumentParser
 from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
+from crawler.pipeline import PipelineCrawler
+from crawler.distributed import PartitionedFrontier
+from utils.metrics import profile
+import report
 
 
-def main(config_file, restart):
+def main(config_file, restart, recrawl=False, cache_server=None, node=None):
     cparser = ConfigParser()
     cparser.read(config_file)
+    if node is not None:
+        if "DISTRIBUTED" not in cparser:
+            cparser["DISTRIBUTED"] = {}
+        cparser["DISTRIBUTED"]["NODEID"] = str(node)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    if cache_server:
+        # A local stand-in (benchmarks/cache_server.py): no registration.
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    config.recrawl = recrawl
+    crawler_class = PipelineCrawler if config.parser_processes else Crawler
+    if len(config.nodes) > 1:
+        crawler = crawler_class(config, restart, frontier_factory=PartitionedFrontier)
+    else:
+        crawler = crawler_class(config, restart)
     crawler.start()
 
 
@@ -19,5 +37,20 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--report", action="store_true", default=False)
+    parser.add_argument("--recrawl", action="store_true", default=False)
+    parser.add_argument("--cache_server", type=str, default=None,
+                        help="host:port of a cache server to use without registering")
+    # Saves a cProfile of the whole run (all threads) and prints the top
+    # functions and allocation sites.
+    parser.add_argument("--profile", type=str, nargs="?", const="crawler.pstats")
+    parser.add_argument("--node", type=int, default=None,
+                        help="index of this node in NODES for a distributed crawl")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    if args.report:
+        report.main(args.config_file, args.node)
+    elif args.profile:
+        with profile(args.profile):
+            main(args.config_file, args.restart, args.recrawl, args.cache_server, args.node)
+    else:
+        main(args.config_file, args.restart, args.recrawl, args.cache_server, args.node)
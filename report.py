@@ -0,0 +1,94 @@
+''' Prints the crawl report from the persisted statistics. It only reads the
+statistics file, so it can run while a crawl is still writing to it.
+
+    python3 launch.py --report
+    python3 report.py --config_file config.ini
+
+For a distributed crawl (NODES in the config) the statistics of every node
+are summed, unless --node picks one.
+'''
+import sys
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from utils.config import Config
+from utils.stats import CrawlStats
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are aren't as at be
+because been before being below between both but by can't cannot could
+couldn't did didn't do does doesn't doing don't down during each few for from
+further had hadn't has hasn't have haven't having he he'd he'll he's her here
+here's hers herself him himself his how how's i i'd i'll i'm i've if in into
+is isn't it it's its itself let's me more most mustn't my myself no nor not of
+off on once only or other ought our ours ourselves out over own same shan't
+she she'd she'll she's should shouldn't so some such than that that's the
+their theirs them themselves then there there's these they they'd they'll
+they're they've this those through to too under until up very was wasn't we
+we'd we'll we're we've were weren't what what's when when's where where's
+which while who who's whom why why's with won't would wouldn't you you'd
+you'll you're you've your yours yourself yourselves
+""".split())
+# The tokenizer splits on apostrophes, so also drop the pieces ("don", "t", ...).
+STOPWORDS |= frozenset(
+    part for word in STOPWORDS if "'" in word for part in word.split("'"))
+
+
+def report_lines(stats, n_words=50):
+    ''' Yields the report one line at a time. '''
+    yield f"Unique pages: {stats.unique_pages}"
+    url, words = stats.longest_page
+    yield f"Longest page: {url} ({words} words)"
+    yield ""
+    yield f"{n_words} most common words:"
+    for rank, (word, count) in enumerate(
+            stats.top_words(n_words, exclude=STOPWORDS), 1):
+        yield f"{rank:>3}. {word}, {count}"
+    yield ""
+    yield "ics.uci.edu subdomains:"
+    for host, pages in stats.subdomain_counts():
+        yield f"http://{host}, {pages}"
+
+
+def write_report(stats_files, out=sys.stdout, n_words=50):
+    ''' Writes the report of one statistics file, or of a list of them summed. '''
+    if isinstance(stats_files, str):
+        stats = CrawlStats(stats_files, readonly=True)
+    else:
+        stats = CrawlStats.merged(stats_files)
+    try:
+        for line in report_lines(stats, n_words):
+            out.write(line + "\n")
+    finally:
+        stats.close()
+
+
+def node_config(cparser, node):
+    if "DISTRIBUTED" not in cparser:
+        cparser["DISTRIBUTED"] = {}
+    cparser["DISTRIBUTED"]["NODEID"] = str(node)
+    return Config(cparser)
+
+
+def main(config_file, node=None):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    if node is not None:
+        write_report(node_config(cparser, node).stats_file)
+        return
+    config = Config(cparser)
+    if len(config.nodes) > 1:
+        paths = [node_config(cparser, index).stats_file for index in range(len(config.nodes))]
+        # STATS set explicitly is shared by the nodes.
+        write_report(list(dict.fromkeys(paths)))
+    else:
+        write_report(config.stats_file)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--node", type=int, default=None,
+                        help="report on this node of a distributed crawl only")
+    args = parser.parse_args()
+    main(args.config_file, args.node)
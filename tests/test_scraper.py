@@ -0,0 +1,55 @@
+import scraper
+from benchmarks.cache_server import encode_response
+from utils.response import Response, decode_payload
+from utils.url_filter import MALFORMED
+
+WORDS = " ".join(f"word{i}" for i in range(80))
+
+
+def fetched(url, served_at, links):
+    ''' The response for url from a cache server that fetched served_at. '''
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    body = f"<html><body><p>{WORDS}</p>{anchors}</body></html>".encode()
+    payload = encode_response(served_at, 200, {"Content-Type": "text/html"}, body)
+    resp = Response(decode_payload(payload))
+    resp.url = url
+    return resp
+
+
+def test_relative_links_resolve_against_index_page():
+    # The frontier fetches the canonical url; the server says where the page was.
+    resp = fetched("https://www.ics.uci.edu/a/b", "https://www.ics.uci.edu/a/b/index.html",
+                   ["c.html", "../d.html", "/e"])
+    page = scraper.parse_page("https://www.ics.uci.edu/a/b", resp)
+    assert page.links == {
+        "https://www.ics.uci.edu/a/b/c.html", "https://www.ics.uci.edu/a/d.html",
+        "https://www.ics.uci.edu/e"}
+
+
+def test_relative_links_resolve_against_directory():
+    resp = fetched("https://www.ics.uci.edu/dir", "https://www.ics.uci.edu/dir/", ["page.html"])
+    page = scraper.parse_page("https://www.ics.uci.edu/dir", resp)
+    assert page.links == {"https://www.ics.uci.edu/dir/page.html"}
+    assert page.url is None  # not a redirect: the same page under its canonical url
+
+
+def test_anchors_resolve_against_served_url(monkeypatch):
+    monkeypatch.setattr(scraper, "keep_anchors", True)
+    resp = fetched("https://www.ics.uci.edu/dir", "https://www.ics.uci.edu/dir/", ["page.html"])
+    page = scraper.parse_page("https://www.ics.uci.edu/dir", resp)
+    assert page.anchors == {"https://www.ics.uci.edu/dir/page.html": "page.html"}
+
+
+def test_scripts_and_styles_are_not_text():
+    analysis = scraper.PageAnalysis(
+        b"<html><head><style>p { color: red }</style></head><body><p>one two</p>"
+        b"<script>var three = 3;</script>four<noscript>five</noscript></body></html>")
+    assert analysis.tokens == ["one", "two", "four", "five"]
+
+
+def test_malformed_links_are_dropped_alone():
+    resp = fetched("https://www.ics.uci.edu/a", "https://www.ics.uci.edu/a",
+                   ["http://[bad", "//[bad/x", "http://www.ics.uci.edu:99999/x", "ok.html"])
+    page = scraper.parse_page("https://www.ics.uci.edu/a", resp)
+    assert page.links == {"https://www.ics.uci.edu/ok.html"}
+    assert scraper.url_filter.check("http://[bad") == MALFORMED
@@ -0,0 +1,43 @@
+import json
+
+from utils.traps import QUERY_EXPLOSION, TrapDetector
+
+
+def test_query_variants_survive_a_restart(tmp_path):
+    path = str(tmp_path / "frontier.traps")
+    traps = TrapDetector(max_query_variants=3)
+    traps.open(path)
+    for page in range(5):
+        traps.check(f"http://www.ics.uci.edu/list?page={page}")
+    traps.flush()
+
+    resumed = TrapDetector(max_query_variants=3)
+    resumed.open(path)
+    assert resumed.query_variants == traps.query_variants
+    # Accepted before the restart, so still accepted; a new one is not.
+    assert resumed.check("http://www.ics.uci.edu/list?page=2") is None
+    assert resumed.check("http://www.ics.uci.edu/list?page=9") == QUERY_EXPLOSION
+
+
+def test_digests_of_older_files_move_to_the_variant_file(tmp_path):
+    path = str(tmp_path / "frontier.traps")
+    traps = TrapDetector()
+    traps.open(path)
+    traps.check("http://www.ics.uci.edu/list?page=1")
+    traps.flush()
+    expected = traps.query_variants
+    # The digests as older versions kept them: a JSON list after the count.
+    with open(path) as state_file:
+        state = json.load(state_file)
+    state["query_variants"] = {
+        template: [entry[0], sorted(entry[1])] for template, entry in expected.items()}
+    with open(path, "w") as state_file:
+        json.dump(state, state_file)
+    (tmp_path / "frontier.traps.variants").unlink()
+
+    migrated = TrapDetector()
+    migrated.open(path)
+    migrated.flush()
+    resumed = TrapDetector()
+    resumed.open(path)
+    assert resumed.query_variants == expected
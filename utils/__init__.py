@@ -1,35 +1,29 @@
-import os
-import logging
 from hashlib import sha256
 from urllib.parse import urlparse
 
+from utils.canonical import canonicalize
+from utils.logs import logs
+
 def get_logger(name, filename=None):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-    return logger
+    # Queued and written by a background thread, see utils/logs.py.
+    return logs.get_logger(name, filename)
 
 
-def get_urlhash(url):
-    parsed = urlparse(url)
-    # everything other than scheme.
+def _urlkey(url):
+    parsed = urlparse(canonicalize(url))
+    netloc = parsed.netloc[4:] if parsed.netloc.startswith("www.") else parsed.netloc
+    # everything other than scheme (and a leading www.).
     return sha256(
-        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
-        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
+        f"{netloc}/{parsed.path}/{parsed.params}/"
+        f"{parsed.query}/{parsed.fragment}".encode("utf-8"))
+
+def get_urlhash(url):
+    return _urlkey(url).hexdigest()
+
+def get_urldigest(url):
+    # The first 64 bits of get_urlhash as an int, for utils.seen.SeenSet.
+    return int.from_bytes(_urlkey(url).digest()[:8], "big")
 
 def normalize(url):
-    if url.endswith("/"):
-        return url.rstrip("/")
-    return url
+    # See utils/canonical.py; this includes stripping the trailing slash.
+    return canonicalize(url)
@@ -0,0 +1,84 @@
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+# Query parameters that never change the page, only who is tracked or how it
+# is shared. Extended from config.ini (STRIPPARAMS) by configure().
+STRIP_PARAMS = {
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+    "fbclid", "gclid", "replytocom", "share", "sessionid", "session_id", "sid",
+    "phpsessid", "jsessionid", "aspsessionid", "cfid", "cftoken", "ical", "outlook-ical",
+}
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+INDEX_PAGES = re.compile(r"/(?:index|default)\.(?:html?|php|aspx?)$", re.IGNORECASE)
+PATH_SESSION = re.compile(r";(?:jsessionid|phpsessid|sid)=[^/?]*", re.IGNORECASE)
+ESCAPE = re.compile(r"%([0-9A-Fa-f]{2})")
+UNRESERVED = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+
+def configure(strip_params):
+    ''' Adds more query parameters to drop during canonicalization. '''
+    STRIP_PARAMS.update(param.strip().lower() for param in strip_params if param.strip())
+
+
+def _escape(match):
+    ''' Decodes escapes of unreserved characters, upper-cases the rest. '''
+    char = chr(int(match.group(1), 16))
+    return char if char in UNRESERVED else "%" + match.group(1).upper()
+
+
+def _remove_dot_segments(path):
+    ''' RFC 3986 section 5.2.4. '''
+    output = list()
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(output) > 1:
+                output.pop()
+        elif segment != ".":
+            output.append(segment)
+    if path.endswith(("/.", "/..")):
+        output.append("")
+    return "/".join(output)
+
+
+def canonicalize(url):
+    ''' The one spelling of url the crawler stores, hashes and fetches.
+    Lower-cases scheme and host, drops default ports, the fragment, session
+    ids and tracking parameters, resolves dot segments and index pages,
+    normalizes percent-encoding and sorts the query. Like the old
+    utils.normalize, a trailing slash is removed. The host keeps any "www."
+    since that is what gets fetched; utils.get_urlhash ignores it. '''
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:  # IPv6 literal
+        host = f"[{host}]"
+    netloc = host
+    if port is not None and str(port) != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else "")
+        netloc = f"{userinfo}@{netloc}"
+
+    path = ESCAPE.sub(_escape, PATH_SESSION.sub("", parts.path))
+    path = _remove_dot_segments(path) if "." in path else path
+    # Trailing slashes go first, so index.html/ is caught too, and index
+    # pages go until none is left: canonicalizing again changes nothing.
+    path = path.rstrip("/")
+    while INDEX_PAGES.search(path):
+        path = INDEX_PAGES.sub("", path).rstrip("/")
+
+    query = list()
+    for pair in parts.query.split("&"):
+        if not pair:
+            continue
+        key = pair.split("=", 1)[0]
+        if key.lower() in STRIP_PARAMS or key.lower().startswith("utm_"):
+            continue
+        query.append(ESCAPE.sub(_escape, pair))
+    query.sort()
+    return urlunsplit((scheme, netloc, path, "&".join(query), ""))
@@ -8,12 +8,76 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        # Parser processes for crawler.pipeline; 0 parses in the worker threads.
+        self.parser_processes = int(config["LOCAL PROPERTIES"].get("PARSERS", 0))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        # host:port of every node of a distributed crawl (crawler/distributed.py)
+        # and the index of this one; each node keeps its own save file.
+        distributed = config["DISTRIBUTED"] if "DISTRIBUTED" in config else {}
+        self.nodes = [node.strip() for node in distributed.get("NODES", "").split(",") if node.strip()]
+        self.node_id = int(distributed.get("NODEID", 0))
+        if len(self.nodes) > 1:
+            self.save_file = f"{self.save_file}.node{self.node_id}"
+        # Links for other nodes are sent in batches of FORWARDBATCH urls, or every FORWARDINTERVAL seconds.
+        self.forward_batch = int(distributed.get("FORWARDBATCH", 500))
+        self.forward_interval = float(distributed.get("FORWARDINTERVAL", 0.5))
+        # Save file backend; None picks the one of an existing save file (crawler/store.py).
+        self.store = config["LOCAL PROPERTIES"].get("STORE", "").strip() or None
+        self.flush_size = int(config["LOCAL PROPERTIES"].get("FLUSHSIZE", 1000))
+        self.flush_interval = float(config["LOCAL PROPERTIES"].get("FLUSHINTERVAL", 5))
+        # Snapshot of the frontier's queue and seen urls, plus a journal of the
+        # changes since, rewritten once the journal has CHECKPOINTSIZE records
+        # (crawler/checkpoint.py); resuming reads it instead of the save file.
+        self.checkpoint_file = config["LOCAL PROPERTIES"].get("CHECKPOINT", f"{self.save_file}.checkpoint")
+        self.checkpoint_size = int(config["LOCAL PROPERTIES"].get("CHECKPOINTSIZE", 200000))
+        # Report statistics, kept next to the save file unless STATS says otherwise.
+        self.stats_file = config["LOCAL PROPERTIES"].get("STATS", f"{self.save_file}.stats")
+        # Bits of the Bloom filter in front of the frontier's seen-url set (0 disables).
+        self.bloom_bits = int(config["LOCAL PROPERTIES"].get("BLOOMBITS", 0))
+        # Url templates learned to be traps (utils/traps.py).
+        self.traps_file = config["LOCAL PROPERTIES"].get("TRAPS", f"{self.save_file}.traps")
+        # Prefix of the link graph files (utils/link_graph.py); empty records no link graph.
+        self.link_graph_file = config["LOCAL PROPERTIES"].get("LINKGRAPH", "").strip()
+        if self.link_graph_file and len(self.nodes) > 1:
+            self.link_graph_file = f"{self.link_graph_file}.node{self.node_id}"
+        # Fetched robots.txt files, refetched after ROBOTSTTL seconds.
+        self.robots_file = config["LOCAL PROPERTIES"].get("ROBOTS", f"{self.save_file}.robots")
+        self.robots_ttl = float(config["CRAWLER"].get("ROBOTSTTL", 86400))
+        # Sitemaps listed in a host's robots.txt that are read to seed the frontier (0 disables).
+        self.max_sitemaps = int(config["CRAWLER"].get("MAXSITEMAPS", 5))
+        # Last fetch of every url (crawler/recrawl.py) and, for --recrawl, the
+        # default, shortest and longest time before a page is fetched again.
+        self.fetches_file = config["LOCAL PROPERTIES"].get("FETCHES", f"{self.save_file}.fetches")
+        self.revisit_default = float(config["CRAWLER"].get("REVISITDEFAULT", 86400))
+        self.revisit_min = float(config["CRAWLER"].get("REVISITMIN", 3600))
+        self.revisit_max = float(config["CRAWLER"].get("REVISITMAX", 30 * 86400))
+        # Snapshot file of utils/metrics.py (.json, else Prometheus text), rewritten
+        # every METRICSINTERVAL seconds; no file disables the metrics.
+        self.metrics_file = config["LOCAL PROPERTIES"].get("METRICS", "").strip()
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICSINTERVAL", 10))
+        # Logging (utils/logs.py): the directory of the log files, the level of
+        # the files and of the console, rotation size and backups, and the
+        # JSON-lines file of fetched/rejected/duplicate events (empty disables it).
+        self.log_dir = config["LOCAL PROPERTIES"].get("LOGDIR", "Logs")
+        self.log_level = config["LOCAL PROPERTIES"].get("LOGLEVEL", "INFO")
+        self.console_level = config["LOCAL PROPERTIES"].get("CONSOLELEVEL", "INFO")
+        self.log_max_bytes = int(config["LOCAL PROPERTIES"].get("LOGMAXBYTES", 10 * 2**20))
+        self.log_backups = int(config["LOCAL PROPERTIES"].get("LOGBACKUPS", 5))
+        self.events_file = config["LOCAL PROPERTIES"].get("EVENTS", "events.jsonl").strip()
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        # Seconds before a request to the cache server is abandoned, how many
+        # times it is retried, and the base of the exponential backoff between tries.
+        self.download_timeout = float(config["CONNECTION"].get("TIMEOUT", 60))
+        self.download_retries = int(config["CONNECTION"].get("RETRIES", 3))
+        self.download_backoff = float(config["CONNECTION"].get("BACKOFF", 0.5))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        # Extra query parameters dropped from every url (utils/canonical.py).
+        self.strip_params = config["CRAWLER"].get("STRIPPARAMS", "").split(",")
 
-        self.cache_server = None
\ No newline at end of file
+        self.cache_server = None
+        # Set by launch.py --recrawl: requeue completed urls that are due.
+        self.recrawl = False
\ No newline at end of file
@@ -1,21 +1,47 @@
 import requests
-import cbor
 import time
+from threading import local
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from utils.response import Response
+from utils.response import Response, decode_payload
 
-def download(url, config, logger=None):
+# One Session per worker thread, each keeping its connection to the cache
+# server alive between downloads.
+_sessions = local()
+
+def get_session(config):
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = requests.Session()
+        retries = Retry(
+            total=config.download_retries, backoff_factor=config.download_backoff)
+        session.mount("http://", HTTPAdapter(
+            pool_connections=1, pool_maxsize=1, max_retries=retries))
+        _sessions.session = session
+    return session
+
+def cache_request(url, config):
+    ''' Query parameters for the cache server, shared with the async path. '''
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    return f"http://{host}:{port}/", [("q", f"{url}"), ("u", f"{config.user_agent}")]
+
+def to_response(status_code, content, url, logger=None):
+    ''' Decodes a cache server reply, or builds an error Response for it. '''
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if content:
+            return Response(decode_payload(content))
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error <{status_code}> with url {url}.")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
+        "error": f"Spacetime Response error <{status_code}> with url {url}.",
+        "status": status_code,
         "url": url})
+
+def download(url, config, logger=None):
+    server, params = cache_request(url, config)
+    resp = get_session(config).get(
+        server, params=params, timeout=config.download_timeout)
+    return to_response(resp.status_code, resp.content, url, logger)
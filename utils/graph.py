@@ -0,0 +1,151 @@
+import mmap
+import os
+from functools import cached_property
+
+import numpy as np
+
+from utils.link_graph import EDGE, files, url_digest
+
+
+def build_csr(rows, cols, n):
+    ''' (indptr, indices, order) of the n x n adjacency matrix with an edge
+    rows[i] -> cols[i] for every i: the targets of row r are
+    indices[indptr[r]:indptr[r + 1]], and order maps every position in
+    indices back to i. The sort is stable, so edges keep the order they
+    were recorded in within a row. '''
+    order = np.argsort(rows, kind="stable")
+    indices = cols[order]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, indices, order
+
+
+def _map(path):
+    ''' A read-only mmap of path, or empty bytes if it is empty. '''
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return b""
+    with open(path, "rb") as mapped:
+        return mmap.mmap(mapped.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LinkIndex(object):
+    ''' Adjacency index over a link graph written by utils.link_graph.LinkGraph,
+    for ranking pages and reading the anchor text that points at them.
+
+    The edge, url and anchor files are memory-mapped, not read into Python
+    objects. The out-link and in-link CSR arrays are built with numpy the
+    first time they are needed, and PageRank and the degrees are vectorized
+    over them, so millions of edges take seconds. Edges to urls past the
+    end of the url file (a crawl still writing) are left out, and so are
+    links from a page to itself unless self_links is set. '''
+
+    def __init__(self, path, self_links=False):
+        self.paths = files(path)
+        self.url_data = _map(self.paths["urls"])
+        self.url_ends = np.flatnonzero(np.frombuffer(self.url_data, dtype=np.uint8) == ord("\n"))
+        self.n = len(self.url_ends)
+        count = os.path.getsize(self.paths["edges"]) // EDGE.itemsize if os.path.exists(self.paths["edges"]) else 0
+        self.edges = (np.memmap(self.paths["edges"], dtype=EDGE, mode="r", shape=(count,))
+                      if count else np.zeros(0, dtype=EDGE))
+        src, dst = self.edges["src"], self.edges["dst"]
+        keep = (src < self.n) & (dst < self.n)
+        if not self_links:
+            keep &= src != dst
+        # Edge numbers in the edge file of the edges indexed.
+        self.edge_ids = np.flatnonzero(keep)
+        self.src = src[self.edge_ids]
+        self.dst = dst[self.edge_ids]
+        self.anchor_data = _map(self.paths["anchors"])
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def edge_count(self):
+        return len(self.edge_ids)
+
+    @cached_property
+    def out_csr(self):
+        ''' (indptr, targets, edge positions) by source url id. '''
+        return build_csr(self.src, self.dst, self.n)
+
+    @cached_property
+    def in_csr(self):
+        ''' (indptr, sources, edge positions) by target url id. '''
+        return build_csr(self.dst, self.src, self.n)
+
+    def url(self, url_id):
+        start = int(self.url_ends[url_id - 1]) + 1 if url_id else 0
+        return self.url_data[start:int(self.url_ends[url_id])].decode("utf-8", "replace")
+
+    @cached_property
+    def _sorted_digests(self):
+        digests = np.fromfile(self.paths["digests"], dtype="<u8")[:self.n]
+        order = np.argsort(digests, kind="stable")
+        return digests[order], order
+
+    def url_id(self, url):
+        ''' The id of url (canonical, as the crawler stores it), None if it
+        is not in the graph. '''
+        digests, order = self._sorted_digests
+        digest = np.uint64(url_digest(url))
+        position = int(np.searchsorted(digests, digest))
+        if position < len(digests) and digests[position] == digest:
+            return int(order[position])
+        return None
+
+    def out_links(self, url_id):
+        indptr, targets, _ = self.out_csr
+        return targets[indptr[url_id]:indptr[url_id + 1]]
+
+    def in_links(self, url_id):
+        indptr, sources, _ = self.in_csr
+        return sources[indptr[url_id]:indptr[url_id + 1]]
+
+    def anchors(self, url_id):
+        ''' The non-empty anchor texts of the links to url_id. '''
+        indptr, _, positions = self.in_csr
+        offsets = self.edges["anchor"][self.edge_ids[positions[indptr[url_id]:indptr[url_id + 1]]]]
+        texts = list()
+        for offset in offsets[offsets > 0].tolist():
+            end = self.anchor_data.find(b"\n", offset)
+            texts.append(self.anchor_data[offset:end].decode("utf-8", "replace"))
+        return texts
+
+    def in_degree(self):
+        return np.bincount(self.dst, minlength=self.n)
+
+    def out_degree(self):
+        return np.diff(self.out_csr[0])
+
+    def pagerank(self, damping=0.85, tol=1e-6, max_iter=100):
+        ''' PageRank of every url id by power iteration, summing to 1. Pages
+        without out-links (every url not crawled yet) spread their rank over
+        all pages. Stops once the L1 change is below tol. '''
+        if not self.n:
+            return np.zeros(0)
+        indptr, targets, _ = self.out_csr
+        degree = np.diff(indptr)
+        dangling = degree == 0
+        rank = np.full(self.n, 1.0 / self.n)
+        share = np.zeros(self.n)
+        for _ in range(max_iter):
+            np.divide(rank, degree, out=share, where=~dangling)
+            spread = (damping * rank[dangling].sum() + 1.0 - damping) / self.n
+            new = np.bincount(targets, weights=np.repeat(share, degree), minlength=self.n)
+            new *= damping
+            new += spread
+            change = np.abs(new - rank).sum()
+            rank = new
+            if change < tol:
+                break
+        return rank
+
+    def top(self, scores, k=10):
+        ''' [(url, score)] of the k highest scores, best first. '''
+        k = min(k, len(scores))
+        if not k:
+            return []
+        best = np.argpartition(scores, -k)[-k:]
+        best = best[np.argsort(scores[best])[::-1]]
+        return [(self.url(int(url_id)), scores[url_id].item()) for url_id in best]
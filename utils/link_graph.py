@@ -0,0 +1,179 @@
+import hashlib
+import os
+import struct
+import time
+from threading import RLock
+
+import numpy as np
+
+from utils.metrics import metrics
+
+FLUSH_TIME = metrics.histogram("link_graph_flush_seconds", "Appending buffered edges to the link graph.")
+
+# One edge: source url id, target url id and the offset of its anchor text
+# in the anchors file, where every text ends with a newline. The anchors file
+# starts with an empty text, so offset 0 means no anchor text.
+EDGE = np.dtype([("src", "<u4"), ("dst", "<u4"), ("anchor", "<u8")])
+EDGE_STRUCT = struct.Struct("<IIQ")
+# Anchor texts are cut to this many characters.
+MAX_ANCHOR = 200
+
+
+def url_digest(url):
+    ''' 64-bit digest of an already canonical url, cheaper than
+    utils.get_urldigest since the url is not canonicalized again. '''
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def clean_anchor(text):
+    ''' Anchor text on one line with runs of whitespace collapsed. '''
+    return " ".join(text.split())[:MAX_ANCHOR]
+
+
+def files(path):
+    ''' The files of the link graph at path: urls (one per line, the line
+    number is the url id), the digest of each url, the edges and the anchor
+    texts. '''
+    return {name: f"{path}.{name}" for name in ("urls", "digests", "edges", "anchors")}
+
+
+class LinkGraph(object):
+    ''' The link graph of the crawl, appended to disk as it is found: every
+    url gets an integer id in the order it is first seen, and every link
+    from an indexed page an edge (source id, target id, anchor text). Edges
+    are fixed-size records, so utils/graph.py can memory-map them and build
+    its index with numpy.
+
+    The url ids of earlier runs are looked up in a sorted array of their
+    digests, so resuming reads one array instead of every url; ids given out
+    since are in a dict. Writes are buffered and appended every flush_size
+    edges or flush_interval seconds, url ids before the edges that use them.
+    Until open() is called nothing is recorded. '''
+
+    def __init__(self, flush_size=10_000, flush_interval=5.0):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.lock = RLock()
+        self.paths = None
+
+    @property
+    def enabled(self):
+        return self.paths is not None
+
+    def open(self, path, restart=False, flush_interval=5.0):
+        ''' Opens the link graph at path (see files), deleting it first on
+        restart. A url or edge cut short by a crash is dropped. '''
+        with self.lock:
+            if self.enabled:
+                self.close()
+            self.flush_interval = flush_interval
+            paths = files(path)
+            if restart:
+                for name in paths.values():
+                    if os.path.exists(name):
+                        os.remove(name)
+            digests = (np.fromfile(paths["digests"], dtype="<u8")
+                       if os.path.exists(paths["digests"]) else np.zeros(0, "<u8"))
+            line_ends = np.zeros(0, np.int64)
+            if os.path.exists(paths["urls"]):
+                line_ends = np.flatnonzero(np.fromfile(paths["urls"], dtype=np.uint8) == ord("\n"))
+            count = min(len(digests), len(line_ends))
+            self._truncate(paths["urls"], int(line_ends[count - 1]) + 1 if count else 0)
+            self._truncate(paths["digests"], 8 * count)
+            digests = digests[:count]
+            if not os.path.exists(paths["anchors"]) or not os.path.getsize(paths["anchors"]):
+                with open(paths["anchors"], "wb") as anchors_file:
+                    anchors_file.write(b"\n")
+            self.anchors_size = os.path.getsize(paths["anchors"])
+            self.edge_count = self._check_edges(paths["edges"], count, self.anchors_size)
+            self.order = np.argsort(digests, kind="stable").astype("<u4")
+            self.sorted_digests = digests[self.order]
+            self.ids = dict()
+            self.url_count = count
+            self.pending_urls = bytearray()
+            self.pending_digests = bytearray()
+            self.pending_edges = bytearray()
+            self.pending_anchors = bytearray()
+            self.last_flush = time.monotonic()
+            self.paths = paths
+
+    @staticmethod
+    def _truncate(path, size):
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    def _check_edges(self, path, url_count, anchors_size):
+        ''' Drops a partial last record and the edges from the first one
+        that points past the urls or anchors on disk; returns the number of
+        edges kept. '''
+        if not os.path.exists(path):
+            return 0
+        count = os.path.getsize(path) // EDGE.itemsize
+        if count:
+            edges = np.memmap(path, dtype=EDGE, mode="r", shape=(count,))
+            bad = np.flatnonzero((edges["src"] >= url_count) | (edges["dst"] >= url_count)
+                                 | (edges["anchor"] >= anchors_size))
+            if len(bad):
+                count = int(bad[0])
+            del edges
+        self._truncate(path, count * EDGE.itemsize)
+        return count
+
+    def url_id(self, url):
+        ''' The id of url, given it one if it has none yet. '''
+        digest = url_digest(url)
+        with self.lock:
+            found = self.ids.get(digest)
+            if found is not None:
+                return found
+            if len(self.sorted_digests):
+                position = int(np.searchsorted(self.sorted_digests, np.uint64(digest)))
+                if position < len(self.sorted_digests) and int(self.sorted_digests[position]) == digest:
+                    return int(self.order[position])
+            found = self.ids[digest] = self.url_count
+            self.url_count += 1
+            # One url per line, so a stray newline is escaped.
+            self.pending_urls += url.replace("\n", "%0A").encode("utf-8", "replace") + b"\n"
+            self.pending_digests += digest.to_bytes(8, "little")
+            return found
+
+    def add(self, source, links):
+        ''' Records the links of the page at source, (url, anchor text)
+        pairs; anchor text may be None or empty. '''
+        if not self.enabled:
+            return
+        with self.lock:
+            source_id = self.url_id(source)
+            for url, anchor in links:
+                offset = 0
+                if anchor:
+                    anchor = clean_anchor(anchor)
+                if anchor:
+                    offset = self.anchors_size + len(self.pending_anchors)
+                    self.pending_anchors += anchor.encode("utf-8", "replace") + b"\n"
+                self.pending_edges += EDGE_STRUCT.pack(source_id, self.url_id(url), offset)
+                self.edge_count += 1
+            if (len(self.pending_edges) >= self.flush_size * EDGE.itemsize
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        ''' Appends the buffered urls, anchors and edges, in that order, so
+        the edges on disk only ever point at urls and anchors on disk. '''
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.enabled or not (self.pending_urls or self.pending_edges):
+                return
+            with FLUSH_TIME.time():
+                for name, pending in (("urls", self.pending_urls), ("digests", self.pending_digests),
+                                      ("anchors", self.pending_anchors), ("edges", self.pending_edges)):
+                    if pending:
+                        with open(self.paths[name], "ab") as out:
+                            out.write(pending)
+                        pending.clear()
+                self.anchors_size = os.path.getsize(self.paths["anchors"])
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.paths = None
@@ -0,0 +1,256 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def level_number(level):
+    ''' logging.INFO for "INFO" or "info"; numbers are kept. '''
+    if isinstance(level, str):
+        number = logging.getLevelName(level.strip().upper())
+        if not isinstance(number, int):
+            raise ValueError(f"unknown log level {level}")
+        return number
+    return level
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    ''' A RotatingFileHandler that does not flush after every record: the
+    listener calls sync() once the queue runs dry, so a burst of records is
+    written in one go. The file size is counted here (in characters) since
+    asking the stream would flush it. '''
+
+    def __init__(self, path, max_bytes, backups):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backups,
+                         encoding="utf-8", delay=True)
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def emit(self, record):
+        try:
+            message = self.format(record) + self.terminator
+            if self.maxBytes and self.size and self.size + len(message) > self.maxBytes:
+                self.doRollover()
+                self.size = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(message)
+            self.size += len(message)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.flush()
+
+
+class EventFormatter(logging.Formatter):
+    ''' One JSON object per line: time, event and the fields of the event. '''
+
+    def format(self, record):
+        return json.dumps(
+            {"time": round(record.created, 3), "event": record.getMessage(), **record.event})
+
+
+class Router(logging.Handler):
+    ''' The one handler of the listener. Events go to the JSON-lines file,
+    other records to the console and to the log file named by the logger
+    (see get_logger). '''
+
+    def __init__(self, directory="Logs", level=logging.INFO, console_level=logging.INFO,
+                 max_bytes=10 * 2**20, backups=5, events="events.jsonl"):
+        super().__init__(level)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.files = dict()
+        self.console = logging.StreamHandler()
+        self.console.setLevel(console_level)
+        self.console.setFormatter(logging.Formatter(FORMAT))
+        self.events = None
+        if events:
+            os.makedirs(directory, exist_ok=True)
+            self.events = BufferedRotatingFileHandler(
+                os.path.join(directory, events), max_bytes, backups)
+            self.events.setFormatter(EventFormatter())
+
+    def handle(self, record):
+        if hasattr(record, "event"):
+            if self.events is not None:
+                self.events.handle(record)
+            return
+        if record.levelno >= self.level:
+            self.file(record.logfile).handle(record)
+        if record.levelno >= self.console.level:
+            self.console.handle(record)
+
+    def file(self, name):
+        handler = self.files.get(name)
+        if handler is None:
+            # Records of child processes come from a second listener thread.
+            with self.lock:
+                handler = self.files.get(name)
+                if handler is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    handler = BufferedRotatingFileHandler(
+                        os.path.join(self.directory, f"{name}.log"), self.max_bytes, self.backups)
+                    handler.setFormatter(logging.Formatter(FORMAT))
+                    self.files[name] = handler
+        return handler
+
+    def sync(self):
+        for handler in list(self.files.values()) + [self.events]:
+            if handler is not None:
+                handler.sync()
+
+    def close(self):
+        for handler in list(self.files.values()) + [self.events]:
+            if handler is not None:
+                handler.close()
+        super().close()
+
+
+class Listener(QueueListener):
+    ''' Writes the batch out whenever it has emptied the queue. '''
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get(block=False)
+        except queue.Empty:
+            self.handlers[0].sync()
+            return self.queue.get(block=block)
+
+
+class LocalQueueHandler(QueueHandler):
+    ''' Within the process a record is queued as is; formatting it is left
+    to the listener thread. '''
+
+    def prepare(self, record):
+        return record
+
+
+class LogFileFilter(logging.Filter):
+    def __init__(self, logfile):
+        super().__init__()
+        self.logfile = logfile
+
+    def filter(self, record):
+        record.logfile = self.logfile
+        return True
+
+
+class Logs(object):
+    ''' The crawler's logging: every logger from get_logger hands its
+    records to a queue, and a listener thread formats them and writes them
+    to the console, to rotating files and, for events, to a JSON-lines
+    file. Logging a line or an event never waits for the terminal or the
+    disk. Until configure() is called the defaults are used. '''
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.handler = LocalQueueHandler(self.queue)
+        self.router = None
+        self.listener = None
+        self.loggers = list()
+        self.level = logging.INFO
+        self.lock = threading.Lock()
+        self.event_logger = logging.getLogger("events")
+        self.event_logger.propagate = False
+        self.event_logger.setLevel(logging.INFO)
+        self.event_logger.addHandler(self.handler)
+        atexit.register(self.stop)
+
+    def configure(self, directory="Logs", level="INFO", console_level="INFO",
+                  max_bytes=10 * 2**20, backups=5, events="events.jsonl"):
+        ''' (Re)starts the listener: log files of records at level or above
+        in directory, rotated at max_bytes with backups old files kept, the
+        console from console_level and events in the events file (no file
+        disables them). '''
+        level = level_number(level)
+        console_level = level_number(console_level)
+        with self.lock:
+            self._stop()
+            self.router = Router(directory, level, console_level, max_bytes, backups, events)
+            self.listener = Listener(self.queue, self.router)
+            self.listener.start()
+            self.level = min(level, console_level)
+            for logger in self.loggers:
+                logger.setLevel(self.level)
+            self.event_logger.disabled = not events
+
+    def get_logger(self, name, filename=None):
+        ''' The logger name, writing to <filename or name>.log. Handlers
+        are only added the first time, so asking again is cheap. '''
+        logger = logging.getLogger(name)
+        with self.lock:
+            if self.listener is None and self.handler.queue is self.queue:
+                self.configure_defaults()
+            if self.handler not in logger.handlers:
+                logger.addHandler(self.handler)
+                logger.addFilter(LogFileFilter(filename or name))
+                logger.propagate = False
+                self.loggers.append(logger)
+            logger.setLevel(self.level)
+        return logger
+
+    def configure_defaults(self):
+        self.router = Router()
+        self.listener = Listener(self.queue, self.router)
+        self.listener.start()
+
+    def event(self, kind, url, **fields):
+        ''' Logs a structured event (fetched, rejected, duplicate) about url. '''
+        if not self.event_logger.disabled:
+            fields["url"] = url
+            self.event_logger.info(kind, extra={"event": fields})
+
+    def listen(self, source):
+        ''' Starts writing the records other processes send to source, a
+        multiprocessing queue (see forward_to). Returns the listener, to
+        be stopped once they are done. '''
+        with self.lock:
+            if self.router is None:
+                self.configure_defaults()
+            listener = Listener(source, self.router)
+        listener.start()
+        return listener
+
+    def forward_to(self, target, level=logging.INFO, events=True):
+        ''' Makes a child process send its records to target, a queue a
+        listener in the parent reads (see listen), instead of writing them. '''
+        with self.lock:
+            self._stop()
+            self.handler = QueueHandler(target)
+            self.level = level
+            for logger in self.loggers + [self.event_logger]:
+                logger.handlers = [self.handler]
+                logger.setLevel(level)
+            self.event_logger.disabled = not events
+
+    def stop(self):
+        with self.lock:
+            self._stop()
+
+    def _stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.router.sync()
+            self.router.close()
+            self.listener = None
+
+
+logs = Logs()
+
+
+def forward_to(target, level=logging.INFO, events=True):
+    ''' logs.forward_to, as a function a process pool can pickle for its
+    initializer. '''
+    logs.forward_to(target, level, events)
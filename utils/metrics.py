@@ -0,0 +1,265 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the buckets every timer uses.
+TIME_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _NullTimer(object):
+    ''' What Histogram.time returns while metrics are disabled. '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Counter(object):
+    ''' A count per value of its one optional label (e.g. per host). '''
+    kind = "counter"
+
+    def __init__(self, registry, name, description, label=None):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = dict()
+
+    def inc(self, label_value=None, value=1):
+        if not self.registry.enabled:
+            return
+        with self.registry.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + value
+
+
+class Histogram(object):
+    ''' Counts of observations per bucket, plus their number and sum. '''
+    kind = "histogram"
+
+    def __init__(self, registry, name, description, buckets=TIME_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        # The last slot counts observations above every bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        if not self.registry.enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        ''' Context manager observing the seconds its block took. '''
+        return _Timer(self) if self.registry.enabled else NULL_TIMER
+
+
+class Metrics(object):
+    ''' Counters and histograms for the crawler stages. Disabled until
+    start() is called, and while disabled inc, observe and time return
+    right away, so instrumented code pays one attribute check.
+
+    Once started, a daemon thread writes a snapshot every interval seconds
+    to path: JSON if the name ends in .json, else the Prometheus text
+    format. Metrics recorded in parser processes (crawler/pipeline.py) stay
+    in those processes. '''
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.RLock()
+        self.metrics = dict()
+        self.started = time.monotonic()
+        self.path = None
+        self.stopped = threading.Event()
+        # (time, counter values) of the last snapshot, for the rates.
+        self.last_snapshot = (self.started, dict())
+
+    def counter(self, name, description, label=None):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Counter(self, name, description, label)
+            return metric
+
+    def histogram(self, name, description, buckets=TIME_BUCKETS):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Histogram(self, name, description, buckets)
+            return metric
+
+    def start(self, path, interval=10.0):
+        self.path = path
+        self.enabled = True
+        self.started = time.monotonic()
+        self.last_snapshot = (self.started, dict())
+        self.stopped.clear()
+        threading.Thread(
+            target=self._write_every, args=(interval,), daemon=True).start()
+
+    def _write_every(self, interval):
+        while not self.stopped.wait(interval):
+            self.write()
+
+    def stop(self):
+        ''' Writes a last snapshot and stops the writer thread. '''
+        if self.enabled:
+            self.stopped.set()
+            self.write()
+
+    def snapshot(self):
+        ''' All metrics as a dict. Counters also get their per-second rate
+        since the previous snapshot. '''
+        now = time.monotonic()
+        with self.lock:
+            last_time, last_values = self.last_snapshot
+            elapsed = (now - last_time) or 1.0
+            counters, histograms, current = dict(), dict(), dict()
+            for name, metric in self.metrics.items():
+                if metric.kind == "counter":
+                    values = dict(metric.values)
+                    current[name] = values
+                    previous = last_values.get(name, dict())
+                    counters[name] = {
+                        str(label): {
+                            "count": count,
+                            "rate": (count - previous.get(label, 0)) / elapsed}
+                        for label, count in values.items()}
+                else:
+                    histograms[name] = {
+                        "count": metric.count,
+                        "sum": metric.sum,
+                        "buckets": dict(zip(
+                            [str(bound) for bound in metric.buckets] + ["+Inf"],
+                            metric.counts)),
+                    }
+            self.last_snapshot = (now, current)
+        return {
+            "uptime": now - self.started,
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def prometheus(self):
+        ''' All metrics in the Prometheus text exposition format. '''
+        lines = list()
+        with self.lock:
+            for name, metric in self.metrics.items():
+                full_name = f"crawler_{name}"
+                if metric.kind == "counter":
+                    full_name += "_total"
+                lines.append(f"# HELP {full_name} {metric.description}")
+                lines.append(f"# TYPE {full_name} {metric.kind}")
+                if metric.kind == "counter":
+                    for label, count in metric.values.items():
+                        if label is None:
+                            lines.append(f"{full_name} {count}")
+                        else:
+                            value = str(label).replace("\\", "\\\\").replace('"', '\\"')
+                            lines.append(f'{full_name}{{{metric.label}="{value}"}} {count}')
+                else:
+                    cumulative = 0
+                    for bound, count in zip(
+                            [str(bound) for bound in metric.buckets] + ["+Inf"],
+                            metric.counts):
+                        cumulative += count
+                        lines.append(f'{full_name}_bucket{{le="{bound}"}} {cumulative}')
+                    lines.append(f"{full_name}_sum {metric.sum}")
+                    lines.append(f"{full_name}_count {metric.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        ''' Replaces the snapshot file at path (default: the one given to start). '''
+        path = path or self.path
+        if path is None:
+            return
+        if path.endswith(".json"):
+            text = json.dumps(self.snapshot(), indent=1)
+        else:
+            text = self.prometheus()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as snapshot_file:
+            snapshot_file.write(text)
+        os.replace(tmp_path, path)
+
+
+# The registry the crawler modules record into.
+metrics = Metrics()
+
+
+@contextmanager
+def profile(path, top=30):
+    ''' Runs the block under cProfile, in every thread started inside it,
+    and tracemalloc. The combined profile is saved to path (read it with
+    pstats or snakeviz) and the top functions by cumulative time and the
+    top allocation sites are printed. Before Python 3.12 every thread gets
+    its own profiler; from 3.12 one profiler covers them all, with the
+    threads' calls on one stack, so call counts and cumulative times are
+    approximate there. '''
+    profilers = [cProfile.Profile()]
+    # From Python 3.12 cProfile sits on sys.monitoring, which is process-wide:
+    # the one profiler sees every thread, and no second one can be enabled.
+    per_thread = sys.version_info < (3, 12)
+
+    def start_thread_profiler(frame, event, arg):
+        # Installed by threading.setprofile in each new thread; hands the
+        # thread over to its own cProfile.Profile on the first event.
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+
+    tracemalloc.start()
+    if per_thread:
+        threading.setprofile(start_thread_profiler)
+    profilers[0].enable()
+    try:
+        yield
+    finally:
+        profilers[0].disable()
+        if per_thread:
+            threading.setprofile(None)
+        memory = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for profiler in profilers[1:]:
+            profiler.disable()
+        stats = pstats.Stats(*profilers)
+        stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(top)
+        print(f"traced memory: {current / 2**20:.1f} MiB now, {peak / 2**20:.1f} MiB peak")
+        for stat in memory.statistics("lineno")[:10]:
+            print(stat)
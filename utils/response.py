@@ -1,14 +1,210 @@
 import pickle
+import struct
+
+import cbor
+import requests
+
+# Opcodes of the pickled requests.Response the cache server sends (see
+# find_body): the "_content" key as SHORT_BINUNICODE (protocol 4+) or
+# BINUNICODE, the memo op that may follow it, and the bytes ops with the
+# size of their length field.
+CONTENT_KEYS = (b"\x8c\x08_content", b"X\x08\x00\x00\x00_content")
+MEMO_OPS = {0x94: 1, ord("q"): 2, ord("r"): 5}
+BYTES_OPS = {ord("C"): "<B", ord("B"): "<I", 0x8e: "<Q"}
+FRAME = 0x95
+EMPTY_BYTES = b"C\x00"
+# Payloads below this many bytes are decoded by cbor.loads (see decode_payload).
+SMALL_PAYLOAD = 64 * 1024
+# Bodies below this many bytes are unpickled with the rest of the response:
+# cutting them out and copying them back costs more than copying them once.
+# Above it, reading the headers alone no longer copies the body
+# (benchmarks/response.py).
+LAZY_BODY = 256 * 1024
+
 
 class Response(object):
+    ''' A cache server response. url, status and error are read from the
+    payload right away; raw_response, the pickled requests.Response, is
+    unpickled on first use, and without its body if that is at least
+    LAZY_BODY bytes: content is then copied out of the pickle only when it
+    is read. size is the length of the body, known before anything is
+    unpickled, so a page can be rejected as too large without ever
+    materializing it. '''
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        # bytes or a memoryview into the downloaded payload.
+        self.pickled = resp_dict.get("response")
+        self._raw_response = None
+        self._size = None
+        if isinstance(self.pickled, (bytes, bytearray, memoryview)):
+            self._span = find_body(self.pickled)
+            if self._span is not None:
+                self._size = self._span[2] - self._span[1]
+        else:
+            self.pickled = self._span = None
+
+    @property
+    def raw_response(self):
+        if self._raw_response is None and self.pickled is not None:
+            try:
+                raw = None
+                if self._span is not None and self._size >= LAZY_BODY:
+                    try:
+                        raw = pickle.loads(strip_body(self.pickled, self._span))
+                        raw.__class__ = LazyContentResponse
+                        raw._body = self.pickled[self._span[1]:self._span[2]]
+                    except (TypeError, pickle.UnpicklingError, ValueError, EOFError):
+                        raw = None
+                if raw is None:
+                    raw = pickle.loads(self.pickled)
+            except (TypeError, pickle.UnpicklingError, ValueError, EOFError):
+                self.pickled = None
+                return None
+            self._raw_response = raw
+        return self._raw_response
+
+    @property
+    def size(self):
+        ''' Length of the body in bytes (0 without a response). '''
+        if self._size is None:
+            raw = self.raw_response
+            self._size = len(raw.content) if raw is not None else 0
+        return self._size
+
+    @property
+    def body(self):
+        ''' The body as a memoryview, without copying it out of the payload
+        if it has not been read yet. None without a response. '''
+        raw = self.raw_response
+        if raw is None:
+            return None
+        lazy = getattr(raw, "_body", None)
+        return lazy if lazy is not None else memoryview(raw.content)
+
+    def __getstate__(self):
+        # Sent to parser processes as the pickled bytes; memoryviews and the
+        # decoded response stay behind.
+        state = self.__dict__.copy()
+        state["pickled"] = bytes(self.pickled) if self.pickled is not None else None
+        state["_raw_response"] = None
+        return state
+
+
+class LazyContentResponse(requests.models.Response):
+    ''' A requests.Response whose content is copied out of the payload the
+    first time it is read. '''
+
+    @property
+    def content(self):
+        body = getattr(self, "_body", None)
+        if body is not None:
+            self._content = bytes(body)
+            self._body = None
+        return self._content
+
+
+def find_body(pickled):
+    ''' (opcode offset, body start, body end) of the body bytes in a pickled
+    requests.Response, found without unpickling it, or None if the pickle is
+    not laid out as expected. requests pickles _content first, so the key is
+    near the start. '''
+    head = bytes(pickled[:512])
+    for key in CONTENT_KEYS:
+        pos = head.find(key)
+        if pos >= 0:
+            pos += len(key)
+            break
+    else:
+        return None
+    try:
+        if pickled[pos] in MEMO_OPS:
+            pos += MEMO_OPS[pickled[pos]]
+        fmt = BYTES_OPS.get(pickled[pos])
+        if fmt is None:
+            return None
+        size, = struct.unpack_from(fmt, pickled, pos + 1)
+    except (IndexError, struct.error):
+        return None
+    start = pos + 1 + struct.calcsize(fmt)
+    if start + size > len(pickled):
+        return None
+    return pos, start, start + size
+
+
+def strip_body(pickled, span):
+    ''' pickled with the body at span replaced by b"". A protocol 4+ pickle
+    is cut into frames; the length of the frame holding the body is fixed
+    (a large body is written outside any frame). '''
+    op, _, end = span
+    head = bytearray(pickled[:op])
+    if len(pickled) > 1 and pickled[0] == 0x80 and pickled[1] >= 4:
+        pos = 2
+        while pos < op:
+            if pickled[pos] != FRAME:
+                raise ValueError("unexpected pickle layout")
+            length, = struct.unpack_from("<Q", pickled, pos + 1)
+            if op < pos + 9 + length:
+                struct.pack_into("<Q", head, pos + 1, length - (end - op) + len(EMPTY_BYTES))
+                break
+            pos += 9 + length
+    return bytes(head) + EMPTY_BYTES + bytes(pickled[end:])
+
+
+def decode_payload(content):
+    ''' The cache server's CBOR map, with the pickled response left as a
+    memoryview into content instead of a copy. Anything but a flat map of
+    text keys to ints, strings, bytes and null (or a malformed payload) is
+    handed to cbor.loads, and so are small payloads, which the C decoder
+    copies faster than this walks them. '''
+    if len(content) < SMALL_PAYLOAD:
+        return cbor.loads(content)
+    try:
+        payload = _decode_map(memoryview(content))
+    except (IndexError, struct.error, UnicodeDecodeError):
+        payload = None
+    return payload if payload is not None else cbor.loads(content)
+
+
+def _decode_map(view):
+    pos, kind, count = _cbor_head(view, 0)
+    if kind != 5:
+        return None
+    payload = dict()
+    for _ in range(count):
+        pos, kind, length = _cbor_head(view, pos)
+        if kind != 3:
+            return None
+        key = str(view[pos:pos + length], "utf-8")
+        pos += length
+        pos, kind, value = _cbor_head(view, pos)
+        if kind in (2, 3):
+            if pos + value > len(view):
+                return None
+            data = view[pos:pos + value]
+            pos += value
+            value = str(data, "utf-8") if kind == 3 else data
+        elif kind == 1:
+            value = -1 - value
+        elif kind == 7 and value in (20, 21, 22):
+            value = {20: False, 21: True, 22: None}[value]
+        elif kind != 0:
+            return None
+        payload[key] = value
+    return payload
+
+
+def _cbor_head(view, pos):
+    ''' (next position, major type, argument) of the CBOR item at pos. '''
+    first = view[pos]
+    kind, info = first >> 5, first & 31
+    if info < 24:
+        return pos + 1, kind, info
+    if info > 27:
+        # Indefinite lengths are left to cbor.loads.
+        raise struct.error("unsupported item")
+    fmt = {24: ">B", 25: ">H", 26: ">I", 27: ">Q"}[info]
+    value, = struct.unpack_from(fmt, view, pos + 1)
+    return pos + 1 + struct.calcsize(fmt), kind, value
@@ -0,0 +1,138 @@
+from array import array
+from threading import RLock
+
+from utils import get_urldigest
+
+
+class BloomFilter(object):
+    ''' Bit array front for SeenSet. The k probe positions are derived from
+    the 64 bit url digest by double hashing, so no extra hashing is done. '''
+    def __init__(self, n_bits, n_hashes=4):
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.bits = bytearray((n_bits + 7) // 8)
+
+    def _positions(self, digest):
+        h1, h2 = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7))
+            for pos in self._positions(digest))
+
+
+class SeenSet(object):
+    ''' Set of urls stored as 64 bit digests (utils.get_urldigest) in an
+    open-addressing array('Q') with linear probing, about 12-23 bytes per url
+    instead of a Python string in a set. A digest of 0 marks an empty slot.
+    With bloom_bits set, a Bloom filter answers "definitely new" without
+    probing the table. '''
+    MAX_LOAD = 0.7
+
+    def __init__(self, capacity=1 << 16, bloom_bits=0):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        # (table, mask) swapped in one assignment when the table grows.
+        self.slots = (array("Q", bytes(8 * size)), size - 1)
+        self.count = 0
+        self.bloom = BloomFilter(bloom_bits) if bloom_bits else None
+        self.lock = RLock()
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def digest(url):
+        return get_urldigest(url) or 1
+
+    @staticmethod
+    def hash_digest(urlhash):
+        ''' digest(url) from get_urlhash(url), without hashing url again. '''
+        return int(urlhash[:16], 16) or 1
+
+    def __contains__(self, url):
+        return self.contains_digest(self.digest(url))
+
+    def add(self, url):
+        ''' Adds url, returning False if it was already in the set. '''
+        return self.add_digest(self.digest(url))
+
+    def contains_digest(self, digest):
+        if self.bloom is not None and digest not in self.bloom:
+            return False
+        table, mask = self.slots
+        i = digest & mask
+        while True:
+            value = table[i]
+            if value == digest:
+                return True
+            if value == 0:
+                return False
+            i = (i + 1) & mask
+
+    def add_digest(self, digest):
+        with self.lock:
+            table, mask = self.slots
+            i = digest & mask
+            while True:
+                value = table[i]
+                if value == digest:
+                    return False
+                if value == 0:
+                    break
+                i = (i + 1) & mask
+            table[i] = digest
+            self.count += 1
+            if self.bloom is not None:
+                self.bloom.add(digest)
+            if self.count > self.MAX_LOAD * (mask + 1):
+                self._grow()
+            return True
+
+    def _grow(self):
+        old = self.slots[0]
+        table = array("Q", bytes(16 * len(old)))
+        mask = len(table) - 1
+        for digest in old:
+            if digest:
+                i = digest & mask
+                while table[i]:
+                    i = (i + 1) & mask
+                table[i] = digest
+        self.slots = (table, mask)
+
+    def snapshot(self):
+        ''' (table, count, bloom bits) for restore(); the table is the array
+        itself, not a copy. '''
+        with self.lock:
+            bloom = self.bloom.bits if self.bloom is not None else b""
+            return self.slots[0], self.count, bloom
+
+    @classmethod
+    def restore(cls, table, count, bloom=b"", bloom_bits=0):
+        ''' A set from a snapshot() without hashing a url again. The Bloom
+        filter is rebuilt from the table if bloom_bits is not the size it
+        was saved with. '''
+        seen = cls(bloom_bits=bloom_bits)
+        seen.slots = (table, len(table) - 1)
+        seen.count = count
+        if seen.bloom is not None:
+            if len(bloom) == len(seen.bloom.bits):
+                seen.bloom.bits[:] = bloom
+            else:
+                for digest in table:
+                    if digest:
+                        seen.bloom.add(digest)
+        return seen
+
+    @property
+    def nbytes(self):
+        table = self.slots[0]
+        size = table.itemsize * len(table)
+        return size + (len(self.bloom.bits) if self.bloom is not None else 0)
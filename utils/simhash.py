@@ -0,0 +1,97 @@
+import re
+from array import array
+from collections import Counter
+from hashlib import md5
+
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+
+
+def tokenize(text):
+    ''' Lowercased runs of ASCII letters and digits, in order. '''
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def token_hash(token):
+    ''' The low 64 bits of the token's md5, read straight from the digest. '''
+    return int.from_bytes(md5(token.encode()).digest()[8:], "big")
+
+
+def simhash_tokens(tokens):
+    ''' 64 bit simhash of a token list. Each distinct token is hashed once
+    and weighted by its count, and the per-bit vote is one matrix product. '''
+    counts = Counter(tokens)
+    if not counts:
+        return 0
+    hashes = np.fromiter(
+        (token_hash(token) for token in counts), dtype=np.uint64,
+        count=len(counts))
+    weights = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    bits = ((hashes[:, None] >> BIT_SHIFTS) & np.uint64(1)).astype(np.int64)
+    votes = weights @ (2 * bits - 1)
+    return int(np.packbits(votes > 0, bitorder="little").view("<u8")[0])
+
+
+class SimhashIndex(object):
+    ''' Near-duplicate index over 64 bit simhash fingerprints.
+
+    The fingerprint is split into distance + 1 blocks. Two fingerprints at
+    most `distance` bits apart must agree exactly on at least one block, so
+    a query only compares against fingerprints that share a block value
+    with it instead of scanning every page crawled so far. '''
+
+    def __init__(self, distance=3, bits=64):
+        self.distance = distance
+        self.bits = bits
+        n_blocks = distance + 1
+        width, extra = divmod(bits, n_blocks)
+        # (shift, mask) of each block; the first `extra` blocks get one more bit.
+        self.blocks = list()
+        shift = 0
+        for i in range(n_blocks):
+            size = width + (1 if i < extra else 0)
+            self.blocks.append((shift, (1 << size) - 1))
+            shift += size
+        self.fingerprints = array("Q")
+        self.urls = list()
+        # One table per block: block value -> array of fingerprint ids.
+        self.tables = [dict() for _ in self.blocks]
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def items(self):
+        return zip(self.urls, self.fingerprints)
+
+    def add(self, url, fingerprint):
+        ''' Stores the fingerprint of url and returns its id. '''
+        fid = len(self.fingerprints)
+        self.fingerprints.append(fingerprint)
+        self.urls.append(url)
+        for table, (shift, mask) in zip(self.tables, self.blocks):
+            key = (fingerprint >> shift) & mask
+            bucket = table.get(key)
+            if bucket is None:
+                bucket = table[key] = array("L")
+            bucket.append(fid)
+        return fid
+
+    def query(self, fingerprint):
+        ''' Returns (url, distance) of an indexed fingerprint within
+        self.distance bits of fingerprint, or None. '''
+        seen = set()
+        for table, (shift, mask) in zip(self.tables, self.blocks):
+            bucket = table.get((fingerprint >> shift) & mask)
+            if bucket is None:
+                continue
+            for fid in bucket:
+                if fid in seen:
+                    continue
+                seen.add(fid)
+                distance = bin(fingerprint ^ self.fingerprints[fid]).count("1")
+                if distance <= self.distance:
+                    return self.urls[fid], distance
+        return None
@@ -0,0 +1,62 @@
+import re
+
+# Reason codes returned by check; None means the response looks like an
+# html page worth parsing. They match the ones in scraper.py.
+NOT_HTML = "not-html"
+TOO_BIG = "too-big"
+
+# Bytes of the body sniffed for a file signature.
+HEAD_SIZE = 4096
+HTML_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+# Types servers use when they do not know better; the body decides.
+VAGUE_TYPES = frozenset({"", "text/plain", "application/octet-stream"})
+# Leading bytes of the binary formats most often found on web servers.
+SIGNATURES = (
+    b"%PDF-", b"%!PS", b"\x89PNG", b"\xff\xd8\xff", b"GIF87a", b"GIF89a",
+    b"PK\x03\x04", b"\x1f\x8b", b"\xd0\xcf\x11\xe0", b"\x7fELF", b"OggS",
+    b"ID3", b"RIFF", b"7z\xbc\xaf", b"Rar!", b"\x00\x00\x01\xba",
+    b"\x00\x00\x01\xb3", b"{\\rtf", b"\xfd7zXZ", b"II*\x00", b"MM\x00*",
+)
+UTF16_BOMS = (b"\xff\xfe", b"\xfe\xff")
+# How an html document starts: a UTF-8 BOM, blanks and comments, then a tag.
+HTML_START = re.compile(
+    rb"(?:\xef\xbb\xbf)?\s*(?:<!--.*?-->\s*)*<(?:!doctype\s+html|html|head|body|\?xml)",
+    re.IGNORECASE | re.DOTALL)
+
+
+def media_type(content_type):
+    ''' "text/html" for "text/html; charset=utf-8". '''
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def signature(head):
+    ''' True if head starts like a binary file: a known file signature, an
+    ISO media file (mp4, mov) or NUL bytes, which text never has (unless
+    it is UTF-16). '''
+    if head.startswith(UTF16_BOMS):
+        return False
+    return (head.startswith(SIGNATURES) or head[4:8] == b"ftyp"
+            or b"\x00" in head[:1024])
+
+
+def check(content_type, content_length, size, head, max_size):
+    ''' Returns None if a response looks like an html page of at most
+    max_size bytes, else NOT_HTML or TOO_BIG, from its Content-Type and
+    Content-Length headers, the size of its body and the first HEAD_SIZE
+    bytes of it. A declared html page is still rejected if it starts like a
+    binary file; a vague type (none, text/plain, octet-stream) is accepted
+    only if the body starts like html. '''
+    if size > max_size:
+        return TOO_BIG
+    try:
+        if content_length is not None and int(content_length) > max_size:
+            return TOO_BIG
+    except ValueError:
+        pass
+    kind = media_type(content_type)
+    head = bytes(head[:HEAD_SIZE])
+    if kind in HTML_TYPES:
+        return NOT_HTML if signature(head) else None
+    if kind in VAGUE_TYPES and not signature(head) and HTML_START.match(head):
+        return None
+    return NOT_HTML
@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import time
+from collections import Counter
+from threading import RLock
+
+from utils.metrics import metrics
+
+FLUSH_TIME = metrics.histogram("stats_flush_seconds", "Merging pending pages into the statistics database.")
+
+
+def to_signed(fingerprint):
+    ''' SQLite integers are signed 64 bit. '''
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class CrawlStats(object):
+    ''' Report data for the crawl: unique pages with their word count and
+    fingerprint, word frequencies and pages per subdomain.
+
+    Counts for new pages are buffered in memory and merged into an SQLite
+    file (by default next to the frontier save file) every flush_size pages
+    or flush_interval seconds, so memory only holds the pending batch and the
+    statistics survive a restart. Without a path the database lives in
+    memory. '''
+
+    def __init__(self, path=":memory:", flush_size=100, flush_interval=5.0,
+                 readonly=False):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.readonly = readonly
+        self.lock = RLock()
+        self.db = None
+        self.open(path)
+
+    def open(self, path, restart=False):
+        ''' (Re)opens the statistics at path, deleting them first on restart.
+        A readonly CrawlStats can read the file while a crawl writes to it. '''
+        with self.lock:
+            if self.db is not None:
+                self.close()
+            if restart and path != ":memory:":
+                for name in (path, path + "-wal", path + "-shm"):
+                    if os.path.exists(name):
+                        os.remove(name)
+            self.path = path
+            if self.readonly:
+                self.db = sqlite3.connect(
+                    f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                self._create(path)
+            self._load_totals()
+            self.pending_pages = list()
+            self.pending_words = Counter()
+            self.pending_subdomains = Counter()
+            self.last_flush = time.monotonic()
+
+    @classmethod
+    def merged(cls, paths):
+        ''' In-memory statistics summed over the files at paths, such as the
+        ones of every node of a distributed crawl. The files are only read. '''
+        stats = cls()
+        with stats.lock:
+            for path in paths:
+                stats.db.execute("ATTACH DATABASE ? AS node", (path,))
+                with stats.db:
+                    stats.db.execute(
+                        "INSERT OR IGNORE INTO pages (url, words, fingerprint) "
+                        "SELECT url, words, fingerprint FROM node.pages")
+                    stats.db.execute(
+                        "INSERT INTO words (word, count) SELECT word, count FROM node.words "
+                        "WHERE true ON CONFLICT(word) DO UPDATE SET count = count + excluded.count")
+                    stats.db.execute(
+                        "INSERT INTO subdomains (host, pages) SELECT host, pages FROM node.subdomains "
+                        "WHERE true ON CONFLICT(host) DO UPDATE SET pages = pages + excluded.pages")
+                stats.db.execute("DETACH DATABASE node")
+            stats._load_totals()
+        return stats
+
+    def _load_totals(self):
+        self.unique_pages = self.db.execute(
+            "SELECT COUNT(*) FROM pages").fetchone()[0]
+        self.longest_page = self.db.execute(
+            "SELECT url, words FROM pages ORDER BY words DESC LIMIT 1"
+            ).fetchone() or (None, 0)
+
+    def _create(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, words INTEGER NOT NULL, "
+            "fingerprint INTEGER NOT NULL)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS words ("
+            "word TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS subdomains ("
+            "host TEXT PRIMARY KEY, pages INTEGER NOT NULL)")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS pages_words ON pages (words)")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS words_count ON words (count)")
+        self.db.commit()
+
+    def add_page(self, url, frequencies, fingerprint, subdomain=None):
+        ''' Counts one unique page. frequencies maps each word on the page to
+        its count; subdomain is the host to count the page under, if any. '''
+        n_words = sum(frequencies.values())
+        with self.lock:
+            self.unique_pages += 1
+            if n_words > self.longest_page[1]:
+                self.longest_page = (url, n_words)
+            self.pending_pages.append((url, n_words, to_signed(fingerprint)))
+            self.pending_words.update(frequencies)
+            if subdomain:
+                self.pending_subdomains[subdomain] += 1
+            if (len(self.pending_pages) >= self.flush_size
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        ''' Merges the pending batch into the database in one transaction. '''
+        with self.lock:
+            if self.pending_pages and not self.readonly:
+                with FLUSH_TIME.time(), self.db:
+                    self.db.executemany(
+                        "INSERT OR IGNORE INTO pages (url, words, fingerprint) "
+                        "VALUES (?, ?, ?)", self.pending_pages)
+                    self.db.executemany(
+                        "INSERT INTO words (word, count) VALUES (?, ?) "
+                        "ON CONFLICT(word) DO UPDATE SET count = count + excluded.count",
+                        self.pending_words.items())
+                    self.db.executemany(
+                        "INSERT INTO subdomains (host, pages) VALUES (?, ?) "
+                        "ON CONFLICT(host) DO UPDATE SET pages = pages + excluded.pages",
+                        self.pending_subdomains.items())
+                self.pending_pages.clear()
+                self.pending_words.clear()
+                self.pending_subdomains.clear()
+            self.last_flush = time.monotonic()
+
+    def fingerprints(self):
+        ''' Yields (url, fingerprint) of every page counted so far. '''
+        self.flush()
+        for url, fingerprint in self.db.execute(
+                "SELECT url, fingerprint FROM pages"):
+            yield url, to_unsigned(fingerprint)
+
+    def top_words(self, n=50, exclude=()):
+        ''' Yields the n most frequent words and their counts, skipping
+        exclude. Rows are read off the count index one at a time. '''
+        self.flush()
+        found = 0
+        for word, count in self.db.execute(
+                "SELECT word, count FROM words ORDER BY count DESC"):
+            if word not in exclude:
+                yield word, count
+                found += 1
+                if found == n:
+                    break
+
+    def subdomain_counts(self):
+        ''' Yields (host, unique pages) for every subdomain, sorted by host. '''
+        self.flush()
+        yield from self.db.execute(
+            "SELECT host, pages FROM subdomains ORDER BY host")
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.db.close()
+            self.db = None
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+from array import array
+from threading import Lock, RLock
+from urllib.parse import urlsplit
+
+from utils import get_logger
+
+DIGITS = re.compile(r"\d+")
+
+# Reason codes returned by TrapDetector.check; None means the url is fine.
+TOO_DEEP = "depth"
+REPEATED_SEGMENT = "repeat"
+BLOCKED_TEMPLATE = "template"
+QUERY_EXPLOSION = "params"
+BLOCKED_PREFIX = "content"
+
+# Records of the query-variant file: length of the path template and number
+# of digests, then the template and the digests as 64-bit integers.
+VARIANTS = struct.Struct("<II")
+
+
+def url_template(url):
+    ''' (path template, query template, path segments) of url. Digit runs
+    are collapsed, so /events/2024-05-01/page/3 and /events/2023-11-17/page/9
+    share the template host/events/#-#-#/page/#; the query template keeps
+    only the sorted parameter names. '''
+    parts = urlsplit(url)
+    segments = [segment for segment in parts.path.split("/") if segment]
+    path = parts.netloc.lower() + "/" + "/".join(
+        DIGITS.sub("#", segment) for segment in segments)
+    names = sorted({pair.split("=", 1)[0] for pair in parts.query.split("&") if pair})
+    query = path + "?" + "&".join(names) if names else path
+    return path, query, segments
+
+
+def url_prefixes(url, max_depth):
+    ''' The host of url and its directories up to max_depth segments deep:
+    host, host/a, host/a/b for host/a/b/c.html. '''
+    parts = urlsplit(url)
+    prefix = parts.netloc.lower()
+    prefixes = [prefix]
+    for segment in parts.path.split("/")[1:-1][:max_depth]:
+        if segment:
+            prefix += "/" + segment
+            prefixes.append(prefix)
+    return prefixes
+
+
+class TrapDetector(object):
+    ''' Learns which url templates are traps from what their pages turned
+    out to be.
+
+    record() counts, per template, the pages fetched and how many of them
+    were low-information or near duplicates; a template with at least
+    min_pages pages of which max_bad_ratio were bad is blocked. check()
+    rejects links that are too deep, repeat a path segment, match a blocked
+    template, or add yet another query string to a path that already has
+    max_query_variants of them without having proven useful. Every check
+    is a few dict lookups. The state is a handful of counters per template
+    and is saved as JSON next to the frontier save file; the digests of the
+    query strings remembered per path are appended to a binary file next to
+    it as they are added (see VARIANTS).
+
+    record() also counts, per host and directory (see url_prefixes), how
+    many responses were not html or too large to index. A directory with at
+    least min_prefix_pages of them, and max_unwanted_ratio of its pages,
+    is blocked, so links into a directory of binary files are dropped
+    whatever their names; a whole host takes ten times as many pages. '''
+
+    def __init__(self, max_depth=12, max_repeats=2, min_pages=10,
+                 max_bad_ratio=0.8, max_query_variants=100, min_prefix_pages=5,
+                 max_unwanted_ratio=0.9, max_prefix_depth=3):
+        self.max_depth = max_depth
+        self.max_repeats = max_repeats
+        self.min_pages = min_pages
+        self.max_bad_ratio = max_bad_ratio
+        self.max_query_variants = max_query_variants
+        self.min_prefix_pages = min_prefix_pages
+        self.max_unwanted_ratio = max_unwanted_ratio
+        self.max_prefix_depth = max_prefix_depth
+        self.lock = RLock()
+        # Serializes the writers of the files; check() and record() only wait
+        # for the copy of the state, not for it to be written.
+        self.flush_lock = Lock()
+        self.path = None
+        self.flush_interval = 5.0
+        self.last_flush = time.monotonic()
+        # template -> [pages fetched, bad pages], and the same per host.
+        self.templates = dict()
+        self.hosts = dict()
+        self.blocked = set()
+        # host or directory -> [pages fetched, pages not html or too big]
+        self.prefixes = dict()
+        self.blocked_prefixes = set()
+        # path template -> [distinct query strings linked so far, digests of
+        # the first max_query_variants of them]; those stay accepted after
+        # the limit, since they may be queued already.
+        self.query_variants = dict()
+        # VARIANTS records of the digests remembered since the last flush.
+        self.pending_variants = bytearray()
+
+    @staticmethod
+    def files(path):
+        return path, path + ".variants"
+
+    def open(self, path, restart=False, flush_interval=5.0):
+        ''' Loads the saved state at path, or deletes it on restart. '''
+        with self.lock:
+            self.path = path
+            self.flush_interval = flush_interval
+            if restart:
+                for name in self.files(path):
+                    if os.path.exists(name):
+                        os.remove(name)
+            if os.path.exists(path):
+                with open(path) as state_file:
+                    state = json.load(state_file)
+                self.templates = state["templates"]
+                self.hosts = state.get("hosts", dict())
+                self.blocked = set(state["blocked"])
+                self.prefixes = state.get("prefixes", dict())
+                self.blocked_prefixes = set(state.get("blocked_prefixes", ()))
+                self.query_variants = dict()
+                for path, entry in state["query_variants"].items():
+                    if isinstance(entry, int):
+                        self.query_variants[path] = [entry, set()]
+                    else:
+                        # Older files kept the digests as a JSON list after the count;
+                        # the next flush moves them to the query-variant file.
+                        self.query_variants[path] = [entry[0], set(entry[1])]
+                        self._append_variants(path, entry[1])
+            for path, digests in self._read_variants():
+                entry = self.query_variants.setdefault(path, [0, set()])
+                entry[1].update(digests)
+                # Digests appended just before a crash may be newer than the counts.
+                entry[0] = max(entry[0], len(entry[1]))
+
+    def _read_variants(self):
+        ''' Yields (path template, digests) of the records in the query-variant
+        file. A record cut short by a crash ends the file. '''
+        variants_path = self.files(self.path)[1]
+        if not os.path.exists(variants_path):
+            return
+        with open(variants_path, "rb") as variants_file:
+            data = variants_file.read()
+        pos = 0
+        while pos + VARIANTS.size <= len(data):
+            size, count = VARIANTS.unpack_from(data, pos)
+            end = pos + VARIANTS.size + size + 8 * count
+            if end > len(data):
+                break
+            path = data[pos + VARIANTS.size:pos + VARIANTS.size + size].decode("utf-8", "replace")
+            digests = array("Q")
+            digests.frombytes(data[end - 8 * count:end])
+            yield path, digests
+            pos = end
+
+    def check(self, url):
+        path, query, segments = url_template(url)
+        if len(segments) > self.max_depth:
+            return TOO_DEEP
+        # Relative-link loops (/a/b/a/b/a/b); numbers like dates repeat legitimately.
+        words = [segment for segment in segments if not segment.isdigit()]
+        if len(words) != len(set(words)):
+            repeats = max(words.count(word) for word in set(words))
+            if repeats > self.max_repeats:
+                return REPEATED_SEGMENT
+        if path in self.blocked or query in self.blocked:
+            return BLOCKED_TEMPLATE
+        if self.blocked_prefixes and any(
+                prefix in self.blocked_prefixes
+                for prefix in url_prefixes(url, self.max_prefix_depth)):
+            return BLOCKED_PREFIX
+        if (query != path
+                and self._count_query_variant(path, url) > self.max_query_variants
+                and not self._proven(query)):
+            return QUERY_EXPLOSION
+        return None
+
+    def suspicion(self, url):
+        ''' (share of bad pages on url's host, share of bad pages under url's
+        template), each 0.0 until something has been fetched there. The
+        frontier uses them to fetch urls from productive hosts and templates
+        first. '''
+        _, query, _ = url_template(url)
+        host = urlsplit(url).netloc.lower()
+        return self._bad_ratio(self.hosts.get(host)), self._bad_ratio(self.templates.get(query))
+
+    @staticmethod
+    def _bad_ratio(counts):
+        # One imaginary good page, so a single bad fetch is not a verdict.
+        return counts[1] / (counts[0] + 1) if counts is not None else 0.0
+
+    def _proven(self, template):
+        ''' True once enough pages of template were fetched and most were useful. '''
+        counts = self.templates.get(template)
+        return (counts is not None and counts[0] >= self.min_pages
+                and counts[1] < counts[0] * (1 - self.max_bad_ratio))
+
+    def _count_query_variant(self, path, url):
+        ''' Counts url's query string under its path template and returns how
+        many distinct ones the path had when it was first seen, so a query
+        string accepted once (and maybe queued) is accepted again when its
+        url is fetched. Past max_query_variants new ones are counted without
+        being remembered, so a repeat counts twice. '''
+        variant = int.from_bytes(
+            hashlib.blake2b(urlsplit(url).query.encode("utf-8"), digest_size=8).digest(), "little")
+        with self.lock:
+            entry = self.query_variants.setdefault(path, [0, set()])
+            if variant in entry[1]:
+                return min(entry[0], self.max_query_variants)
+            entry[0] += 1
+            if entry[0] <= self.max_query_variants:
+                entry[1].add(variant)
+                self._append_variants(path, (variant,))
+            return entry[0]
+
+    def _append_variants(self, path, digests):
+        name = path.encode("utf-8")
+        self.pending_variants += VARIANTS.pack(len(name), len(digests))
+        self.pending_variants += name
+        self.pending_variants += array("Q", digests).tobytes()
+
+    def record(self, url, useful, wanted=True):
+        ''' Counts a fetched page of url's host and template, blocking the template
+        once it keeps producing bad pages. wanted is False for a response that was
+        not html or too big, which counts against url's directories too. '''
+        path, query, _ = url_template(url)
+        host = urlsplit(url).netloc.lower()
+        with self.lock:
+            host_counts = self.hosts.setdefault(host, [0, 0])
+            counts = self.templates.setdefault(query, [0, 0])
+            host_counts[0] += 1
+            counts[0] += 1
+            if not useful:
+                host_counts[1] += 1
+                counts[1] += 1
+            if (counts[0] >= self.min_pages
+                    and counts[1] >= counts[0] * self.max_bad_ratio
+                    and query not in self.blocked):
+                self.blocked.add(query)
+                get_logger("TRAPS").info(
+                    f"Blocking url template {query}: {counts[1]} of {counts[0]} pages were not useful.")
+            for depth, prefix in enumerate(url_prefixes(url, self.max_prefix_depth)):
+                prefix_counts = self.prefixes.setdefault(prefix, [0, 0])
+                prefix_counts[0] += 1
+                if not wanted:
+                    prefix_counts[1] += 1
+                    needed = self.min_prefix_pages * (10 if depth == 0 else 1)
+                    if (prefix_counts[1] >= needed
+                            and prefix_counts[1] >= prefix_counts[0] * self.max_unwanted_ratio
+                            and prefix not in self.blocked_prefixes):
+                        self.blocked_prefixes.add(prefix)
+                        get_logger("TRAPS").info(
+                            f"Blocking links under {prefix}: {prefix_counts[1]} of "
+                            f"{prefix_counts[0]} responses were not html or too big.")
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        ''' Appends the digests remembered since the last flush and rewrites
+        the counters. Only copying the counters holds the lock; they are
+        encoded and written outside it, one flush at a time. '''
+        with self.flush_lock:
+            with self.lock:
+                self.last_flush = time.monotonic()
+                if self.path is None:
+                    return
+                state = {
+                    "templates": copy_counts(self.templates),
+                    "hosts": copy_counts(self.hosts),
+                    "blocked": list(self.blocked),
+                    "prefixes": copy_counts(self.prefixes),
+                    "blocked_prefixes": list(self.blocked_prefixes),
+                    "query_variants": {path: entry[0] for path, entry in self.query_variants.items()},
+                }
+                variants, self.pending_variants = self.pending_variants, bytearray()
+            path, variants_path = self.files(self.path)
+            # Digests go first, so no count on disk covers a digest that is not.
+            if variants:
+                with open(variants_path, "ab") as variants_file:
+                    variants_file.write(variants)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as state_file:
+                json.dump(state, state_file)
+            os.replace(tmp_path, path)
+
+
+def copy_counts(counts):
+    ''' A copy of a dict of [count, count] lists that later updates do not change. '''
+    return dict(zip(counts, map(list.copy, counts.values())))
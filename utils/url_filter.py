@@ -0,0 +1,69 @@
+import re
+from urllib.parse import urlparse
+
+# Reason codes returned by UrlFilter.check; None means the url is accepted.
+BAD_SCHEME = "scheme"
+BAD_DOMAIN = "domain"
+BAD_EXTENSION = "extension"
+TRAP = "trap"
+MALFORMED = "malformed"
+
+
+def unanchor(pattern):
+    ''' Drops a leading ".*" and trailing ".*" / ".*$" from a pattern that is
+    only used with re.search. They do not change what matches, but inside an
+    alternation the leading ".*" makes every search backtrack over the url
+    once per alternative. '''
+    if pattern.startswith(".*"):
+        pattern = pattern[2:]
+    for tail in (".*$", ".*"):
+        if pattern.endswith(tail) and not pattern.endswith("\\" + tail):
+            pattern = pattern[:-len(tail)]
+            break
+    return pattern
+
+
+class UrlFilter(object):
+    ''' Everything is compiled once: allowed domains become a set of host
+    suffixes, file extensions a set looked up by the path's last suffix, and
+    the trap patterns one alternation, so each url costs one urlparse, a few
+    set lookups and at most one regex search. '''
+
+    def __init__(self, domains, extensions, avoid_patterns=()):
+        self.domains = frozenset(domain.lower() for domain in domains)
+        self.subdomain_suffixes = tuple("." + domain for domain in self.domains)
+        self.extensions = frozenset(ext.lower() for ext in extensions)
+        self.avoid = (
+            re.compile("|".join(
+                f"(?:{unanchor(pattern)})" for pattern in avoid_patterns))
+            if avoid_patterns else None)
+
+    def in_domain(self, host):
+        ''' True if host is one of the domains or any subdomain of them. '''
+        if not host:
+            return False
+        return host in self.domains or host.endswith(self.subdomain_suffixes)
+
+    def is_trap(self, url):
+        return self.avoid is not None and self.avoid.search(url) is not None
+
+    def check(self, url):
+        ''' Returns None if url should be crawled, otherwise the reason code
+        it was rejected for. '''
+        try:
+            parsed = urlparse(url)
+            host = parsed.hostname
+            parsed.port
+        except ValueError:  # an unclosed [ in the host or a port out of range
+            return MALFORMED
+        if parsed.scheme not in {"http", "https"}:
+            return BAD_SCHEME
+        if not self.in_domain(host):
+            return BAD_DOMAIN
+        path = parsed.path.lower()
+        dot = path.rfind(".")
+        if dot != -1 and path[dot + 1:] in self.extensions:
+            return BAD_EXTENSION
+        if self.is_trap(url):
+            return TRAP
+        return None